@@ -1,31 +1,40 @@
-from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage
-from config import get_openrouter_api_key, get_openrouter_model
-
-def get_llm():
-    # using openrouter instead of direct openai
-    return ChatOpenAI(
-        model=get_openrouter_model(),
-        temperature=0,  # keep it deterministic
-        api_key=get_openrouter_api_key(),
-        base_url="https://openrouter.ai/api/v1",
-        default_headers={
-            "HTTP-Referer": "https://github.com/your-repo",
-            "X-Title": "Codecraft AI"
-        }
-    )
+from agents.llm import call_llm, acall_llm, response_tokens
+from agents.schemas import (
+    ArchitectOutput, parse_structured, render_architecture, structured_instruction, wants_structured
+)
+from logs import body, get_logger
 
-def architect_agent(state):
-    print("\n[ARCHITECT] AGENT STARTED")
-    print("Task:", state["task"])
+log = get_logger(__name__)
 
-    llm = get_llm()
+def _architect_messages(state):
     # ask it to design the architecture
-    response = llm.invoke([
-        HumanMessage(content=f"Design a high-level architecture for: {state['task']}")
-    ])
+    prompt = f"Design a high-level architecture for: {state['task']}"
+    if wants_structured(state):
+        prompt += "\n\n" + structured_instruction(ArchitectOutput)
+    return [HumanMessage(content=prompt)]
+
+def _architect_result(state, response):
+    spec = parse_structured(response.content, ArchitectOutput) if wants_structured(state) else None
+    # no valid json - just keep the text like before
+    architecture = render_architecture(spec) if spec else response.content
+    log.info("architecture written", extra={"output": body(architecture), "structured": spec is not None})
+
+    return {
+        "architecture": architecture,
+        "architecture_spec": spec.model_dump() if spec else None,
+        "tokens_used": response_tokens(response)
+    }
+
+def architect_agent(state):
+    log.info("architect started", extra={"task": body(state["task"])})
+
+    response = call_llm("architect", _architect_messages(state), state.get("llm_overrides"))
+    return _architect_result(state, response)
 
-    architecture = response.content
-    print("ARCHITECT OUTPUT:\n", architecture)
+async def architect_agent_async(state):
+    # same as architect_agent but doesn't block the event loop
+    log.info("architect started", extra={"task": body(state["task"])})
 
-    return {"architecture": architecture}
+    response = await acall_llm("architect", _architect_messages(state), state.get("llm_overrides"))
+    return _architect_result(state, response)
@@ -0,0 +1,211 @@
+# response cache for agent llm calls
+# all agents run at temperature 0 and the prompts only depend on the state,
+# so the same (model, agent, prompt) gives the same answer - no need to pay twice
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from config import get_llm_cache_settings
+
+
+def normalize_prompt(messages):
+    # ignore trailing whitespace differences so tiny formatting changes still hit
+    parts = []
+    for message in messages:
+        content = message.content if isinstance(message.content, str) else str(message.content)
+        lines = [line.rstrip() for line in content.strip().splitlines()]
+        parts.append(f"{message.type}:" + "\n".join(lines))
+    return "\n\n".join(parts)
+
+
+def make_cache_key(model, agent, messages, max_tokens=None):
+    # max_tokens changes the answer (a low one cuts it short), so it's part of the key
+    prompt_hash = hashlib.sha256(normalize_prompt(messages).encode("utf-8")).hexdigest()
+    key = f"{model}|{agent}|{prompt_hash}"
+    return f"{key}|{max_tokens}" if max_tokens else key
+
+
+class MemoryCache:
+    # in-memory LRU with a max size and a ttl per entry
+
+    def __init__(self, max_entries=1024, ttl=3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteCache:
+    # on-disk tier so the cache survives restarts. aget/aset are for the async
+    # agents: reads go to a thread, writes (commit = fsync) to one writer thread
+
+    def __init__(self, path, ttl=3600):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="llm-cache")
+        with self._lock:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._conn.commit()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, expires_at = row
+            if expires_at < time.time():
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, time.time() + self.ttl)
+            )
+            self._conn.commit()
+
+    async def aget(self, key):
+        return await asyncio.to_thread(self.get, key)
+
+    async def aset(self, key, value):
+        await asyncio.wrap_future(self._writer.submit(self.set, key, value))
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+            self._conn.commit()
+
+
+class ResponseCache:
+    # checks each tier in order, fills the faster tiers on a hit further down
+
+    def __init__(self, tiers):
+        self.tiers = list(tiers)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        for i, tier in enumerate(self.tiers):
+            value = tier.get(key)
+            if value is not None:
+                for faster in self.tiers[:i]:
+                    faster.set(key, value)
+                with self._lock:
+                    self.hits += 1
+                return value
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key, value):
+        for tier in self.tiers:
+            tier.set(key, value)
+
+    async def aget(self, key):
+        # get for the event loop: tiers that touch the disk have their own aget
+        for i, tier in enumerate(self.tiers):
+            value = await tier.aget(key) if hasattr(tier, "aget") else tier.get(key)
+            if value is not None:
+                for faster in self.tiers[:i]:
+                    await _aset(faster, key, value)
+                with self._lock:
+                    self.hits += 1
+                return value
+        with self._lock:
+            self.misses += 1
+        return None
+
+    async def aset(self, key, value):
+        for tier in self.tiers:
+            await _aset(tier, key, value)
+
+    def clear(self):
+        for tier in self.tiers:
+            tier.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "enabled": bool(self.tiers),
+            "tiers": [type(tier).__name__ for tier in self.tiers],
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0
+        }
+
+
+async def _aset(tier, key, value):
+    if hasattr(tier, "aset"):
+        await tier.aset(key, value)
+    else:
+        tier.set(key, value)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def build_response_cache():
+    settings = get_llm_cache_settings()
+    tiers = []
+    if settings["enabled"]:
+        tiers.append(MemoryCache(settings["max_entries"], settings["ttl"]))
+        if settings["sqlite_path"]:
+            tiers.append(SQLiteCache(settings["sqlite_path"], settings["ttl"]))
+    return ResponseCache(tiers)
+
+
+def get_response_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = build_response_cache()
+    return _cache
+
+
+def set_response_cache(cache):
+    # swap in a different cache (anything with get/set/aget/aset/clear/stats works)
+    global _cache
+    with _cache_lock:
+        _cache = cache
@@ -1,32 +1,120 @@
-from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage
-from config import get_openrouter_api_key, get_openrouter_model
-
-def get_llm():
-    return ChatOpenAI(
-        model=get_openrouter_model(),
-        temperature=0,
-        api_key=get_openrouter_api_key(),
-        base_url="https://openrouter.ai/api/v1",
-        default_headers={
-            "HTTP-Referer": "https://github.com/your-repo",
-            "X-Title": "Codecraft AI"
-        }
-    )
+from agents.llm import call_llm, acall_llm, response_tokens
+from agents.edits import EDIT_FORMAT, EditError, apply_edits, changed_functions
+from agents.prompt_budget import compact_architecture
+from agents.sandbox import render_test_results
+from agents.schemas import (
+    CoderOutput, parse_rendered_files, parse_structured, render_files,
+    review_brief, structured_instruction, wants_structured
+)
+from logs import body, get_logger
 
-def coder_agent(state):
-    print("\n[CODER] AGENT STARTED")
+log = get_logger(__name__)
+
+def _is_rewrite(state):
+    return state.get("decision") == "rewrite" and bool(state.get("code")) and bool(state.get("review"))
 
-    llm = get_llm()
+def _coder_messages(state):
     # generate code from the architecture
     prompt = f"""Write Python code based on this architecture:
 
-{state['architecture']}
+{compact_architecture(state)}
+"""
+    if _is_rewrite(state):
+        # a full rewrite still has to address the review, and the prompt must differ
+        # from the first one or the response cache just hands back the rejected code
+        prompt += f"""
+Your previous version was rejected:
+
+{state['code']}
+
+The reviewer asked for these changes:
+
+{review_brief(state)}
+{_failing_tests(state)}
+Write the complete corrected code.
+"""
+    if wants_structured(state):
+        prompt += "\n" + structured_instruction(CoderOutput)
+    return [HumanMessage(content=prompt)]
+
+def _wants_edits(state):
+    # on a rewrite, fix the existing code instead of starting over
+    return state.get("rewrite_mode", "incremental") == "incremental" and _is_rewrite(state)
+
+def _failing_tests(state):
+    # pytest failures from the last run, if there were any
+    results = state.get("test_results")
+    if not results or results["status"] == "passed":
+        return ""
+    return f"\nThe tests failed:\n\n{render_test_results(results)}\n"
+
+def _coder_edit_messages(state):
+    prompt = f"""You wrote this Python code:
+
+{state['code']}
+
+A reviewer asked for changes:
+
+{review_brief(state)}
+{_failing_tests(state)}
+Reply ONLY with the edits needed, as one or more blocks in this exact format:
+
+{EDIT_FORMAT}
+
+The SEARCH part must match the current code exactly. Don't repeat code that doesn't change.
 """
-    response = llm.invoke([HumanMessage(content=prompt)])
+    return [HumanMessage(content=prompt)]
 
-    code = response.content
-    print("GENERATED CODE:\n", code)
+def _coder_result(state, response, code=None, extra_tokens=0):
+    edited = code is not None
+    files = None
+    if edited:
+        files = parse_rendered_files(code) if state.get("code_files") else None
+    else:
+        spec = parse_structured(response.content, CoderOutput) if wants_structured(state) else None
+        files = [f.model_dump() for f in spec.files] if spec else None
+        code = render_files(files) if files else response.content
+    log.info("code written", extra={"output": body(code), "version": state.get("iteration", 0) + 1, "edited": edited})
     # could add code formatting here but keeping it simple for now
 
-    return {"code": code}
+    return {
+        "code": code,
+        "code_files": files or None,
+        # keep the last version around so we can tell if a rewrite changed anything
+        "previous_code": state.get("code"),
+        # lets the tester only redo tests for what changed (None = redo them all)
+        "changed_functions": changed_functions(state["code"], code) if edited else None,
+        "iteration": state.get("iteration", 0) + 1,
+        "tokens_used": response_tokens(response) + extra_tokens
+    }
+
+def coder_agent(state):
+    log.info("coder started")
+
+    spent = 0
+    if _wants_edits(state):
+        response = call_llm("coder", _coder_edit_messages(state), state.get("llm_overrides"))
+        try:
+            return _coder_result(state, response, apply_edits(state["code"], response.content))
+        except EditError as e:
+            log.warning("edits didn't apply, regenerating in full", extra={"error": str(e)})
+            spent = response_tokens(response)
+
+    response = call_llm("coder", _coder_messages(state), state.get("llm_overrides"))
+    return _coder_result(state, response, extra_tokens=spent)
+
+async def coder_agent_async(state):
+    log.info("coder started")
+
+    spent = 0
+    if _wants_edits(state):
+        response = await acall_llm("coder", _coder_edit_messages(state), state.get("llm_overrides"))
+        try:
+            return _coder_result(state, response, apply_edits(state["code"], response.content))
+        except EditError as e:
+            log.warning("edits didn't apply, regenerating in full", extra={"error": str(e)})
+            spent = response_tokens(response)
+
+    response = await acall_llm("coder", _coder_messages(state), state.get("llm_overrides"))
+    return _coder_result(state, response, extra_tokens=spent)
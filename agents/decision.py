@@ -0,0 +1,72 @@
+# local decision strategies for the manager
+# the manager only has to turn the review into "rewrite" or "approve", which
+# often doesn't need a whole llm round-trip. each strategy returns
+# (decision, confidence) or None when it can't tell - then the llm decides
+import re
+
+from config import get_decision_settings
+
+# the reviewer is asked to finish with this line (see agents/reviewer.py)
+VERDICT_INSTRUCTION = "End your review with exactly one line: CHANGES_REQUIRED: yes  or  CHANGES_REQUIRED: no"
+VERDICT_LINE = re.compile(r"CHANGES[_ ]REQUIRED\s*:\s*\**\s*(yes|no)\b", re.IGNORECASE)
+
+# (pattern, weight) - approval phrases are matched first and cut out of the
+# text, so "no changes required" doesn't also count as "changes required"
+APPROVE_PATTERNS = [
+    (r"\bno (further )?changes (are )?(required|needed|necessary)\b", 3),
+    (r"\b(lgtm|looks good to me|ready to (merge|ship))\b", 3),
+    (r"\b(approve|approved)\b", 2),
+    (r"\bno (major |significant |critical )?(issues|problems|bugs)\b", 2),
+    (r"\b(looks good|well[- ]written|well[- ]structured|clean code)\b", 1),
+]
+REWRITE_PATTERNS = [
+    (r"\bchanges (are )?(required|needed|necessary)\b", 3),
+    (r"\b(must|should) be (fixed|changed|rewritten|updated)\b", 2),
+    (r"\b(bug|bugs|incorrect|broken|fails|failing|crash(es)?)\b", 2),
+    (r"\b(missing|does not handle|doesn't handle|not handled)\b", 1),
+    (r"\b(should|needs to|consider)\b", 1),
+]
+
+
+def structured_decision(review):
+    # the reviewer's own CHANGES_REQUIRED line, if it wrote one
+    matches = VERDICT_LINE.findall(review or "")
+    if not matches:
+        return None
+    return ("rewrite" if matches[-1].lower() == "yes" else "approve"), 1.0
+
+
+def keyword_decision(review):
+    # weighted phrase scores, confidence is how lopsided they are
+    text = (review or "").lower()
+    approve = 0
+    for pattern, weight in APPROVE_PATTERNS:
+        hits = len(re.findall(pattern, text))
+        approve += hits * weight
+        text = re.sub(pattern, " ", text)
+    rewrite = sum(len(re.findall(pattern, text)) * weight for pattern, weight in REWRITE_PATTERNS)
+
+    if approve == rewrite:
+        return None
+    confidence = abs(approve - rewrite) / (approve + rewrite + 1)
+    return ("approve" if approve > rewrite else "rewrite"), round(confidence, 3)
+
+
+# strategy name -> (source, check) pairs to try in order
+STRATEGIES = {
+    "structured": [("structured", structured_decision)],
+    "keywords": [("keywords", keyword_decision)],
+    "auto": [("structured", structured_decision), ("keywords", keyword_decision)],
+    "llm": [],
+}
+
+
+def local_decision(review, strategy=None):
+    # returns (decision, confidence, source) if a local strategy is confident enough
+    settings = get_decision_settings()
+    strategy = strategy or settings["strategy"]
+    for source, decide in STRATEGIES.get(strategy, STRATEGIES["auto"]):
+        result = decide(review)
+        if result is not None and result[1] >= settings["min_confidence"]:
+            return result[0], result[1], source
+    return None
@@ -0,0 +1,105 @@
+# helpers for incremental rewrites
+# instead of regenerating the whole file on every rewrite, the coder sends back
+# search/replace edits which we apply here, and the tester only rewrites the
+# tests for functions that actually changed
+import ast
+import re
+
+EDIT_BLOCK = re.compile(
+    r"<<<<<<< SEARCH\n(.*?)\n?=======\n(.*?)\n?>>>>>>> REPLACE",
+    re.DOTALL
+)
+CODE_FENCE = re.compile(r"```(?:python|py)?\n(.*?)```", re.DOTALL)
+
+EDIT_FORMAT = """<<<<<<< SEARCH
+(exact lines from the current code)
+=======
+(the new lines)
+>>>>>>> REPLACE"""
+
+
+class EditError(ValueError):
+    # the edits couldn't be applied, caller should regenerate in full
+    pass
+
+
+def parse_edit_blocks(text):
+    return [(search, replace) for search, replace in EDIT_BLOCK.findall(text)]
+
+
+def apply_edits(code, edits_text):
+    # apply each search/replace block once, in order
+    blocks = parse_edit_blocks(edits_text)
+    if not blocks:
+        raise EditError("No edit blocks found in the coder's reply")
+
+    for search, replace in blocks:
+        if search not in code:
+            # models often get trailing whitespace wrong, try again without it
+            loose_code = "\n".join(line.rstrip() for line in code.splitlines())
+            loose_search = "\n".join(line.rstrip() for line in search.splitlines())
+            if not loose_search or loose_search not in loose_code:
+                raise EditError(f"Edit does not match the current code:\n{search[:200]}")
+            code = loose_code
+            search = loose_search
+        code = code.replace(search, replace, 1)
+    return code
+
+
+def extract_python(text):
+    # llm replies are usually markdown, pull out the python fences if there are any
+    blocks = CODE_FENCE.findall(text or "")
+    return "\n\n".join(blocks) if blocks else (text or "")
+
+
+def _segment(source_lines, node):
+    # source of a node including its decorators
+    start = min([d.lineno for d in getattr(node, "decorator_list", [])] + [node.lineno])
+    return "\n".join(source_lines[start - 1:node.end_lineno])
+
+
+def _definitions(source):
+    # top-level functions/classes and methods -> their source
+    tree = ast.parse(source)
+    lines = source.splitlines()
+    found = {}
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            found[node.name] = _segment(lines, node)
+        if isinstance(node, ast.ClassDef):
+            for item in node.body:
+                if isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                    found[f"{node.name}.{item.name}"] = _segment(lines, item)
+    return found
+
+
+def changed_functions(old_code, new_code):
+    # names of functions/classes that were added or changed, None if we can't tell
+    try:
+        old = _definitions(extract_python(old_code))
+        new = _definitions(extract_python(new_code))
+    except SyntaxError:
+        return None
+    return sorted(name for name, source in new.items() if old.get(name) != source)
+
+
+def merge_tests(old_tests, new_tests, changed):
+    # drop the old tests that cover changed functions and add the new ones
+    old_source = extract_python(old_tests)
+    try:
+        tree = ast.parse(old_source)
+        ast.parse(extract_python(new_tests))
+    except SyntaxError:
+        return None
+
+    lines = old_source.splitlines()
+    short_names = {name.split(".")[-1].lower() for name in changed}
+    kept = []
+    for node in tree.body:
+        is_test = isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)) \
+            and node.name.lower().startswith("test")
+        if is_test and any(name in node.name.lower() for name in short_names):
+            continue
+        kept.append(_segment(lines, node))
+
+    return "\n\n".join(part for part in kept + [extract_python(new_tests)] if part.strip()) + "\n"
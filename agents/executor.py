@@ -0,0 +1,25 @@
+from agents.sandbox import aexecute, execute, render_test_results, wants_execution
+from logs import body, get_logger
+
+log = get_logger(__name__)
+
+def _skip(state):
+    # nothing to run, or execution is turned off
+    return not wants_execution(state) or not state.get("tests") or not state.get("code")
+
+def _executor_result(results):
+    log.info("tests ran", extra={"status": results["status"], "output": body(render_test_results(results))})
+    return {"test_results": results}
+
+def executor_agent(state):
+    # run the generated tests in the sandbox, no llm involved
+    log.info("executor started")
+    if _skip(state):
+        return {"test_results": None}
+    return _executor_result(execute(state))
+
+async def executor_agent_async(state):
+    log.info("executor started")
+    if _skip(state):
+        return {"test_results": None}
+    return _executor_result(await aexecute(state))
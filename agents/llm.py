@@ -0,0 +1,410 @@
+# shared llm clients for all the agents
+# building a new ChatOpenAI per call means a new http client (and a new TLS
+# handshake) every time, so we keep one pooled client for the whole process
+import asyncio
+import threading
+import time
+
+import httpx
+from langchain_core.messages import AIMessage
+from langchain_openai import ChatOpenAI
+from config import (
+    get_openrouter_api_key, get_openrouter_model, get_llm_pool_settings, get_agent_llm_settings,
+    get_retry_settings
+)
+from agents.cache import get_response_cache, make_cache_key
+from agents.prompt_budget import fit_messages
+from agents.ratelimit import RateLimitWaitTooLong, refund_call, reserve_call, settle_call
+from agents.resilience import CircuitOpenError, ModelTimeout, get_breaker, is_retryable, is_timeout, retry_delay
+from metrics import (
+    record_circuit_opened, record_llm_call, record_prompt_size, record_rate_limit_wait,
+    record_rate_limited, record_retry
+)
+from logs import get_logger
+
+OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
+DEFAULT_HEADERS = {
+    "HTTP-Referer": "https://github.com/your-repo",
+    "X-Title": "Codecraft AI"
+}
+
+log = get_logger(__name__)
+
+_lock = threading.Lock()
+_clients = {}  # (model, temperature, extra settings) -> ChatOpenAI
+_http_client = None
+_http_async_client = None
+_llm_factory = None  # set_llm_factory() swaps ChatOpenAI for something else
+
+
+def _pool_config():
+    settings = get_llm_pool_settings()
+    limits = httpx.Limits(
+        max_connections=settings["max_connections"],
+        max_keepalive_connections=settings["max_keepalive_connections"],
+        keepalive_expiry=settings["keepalive_expiry"],
+    )
+    timeout = httpx.Timeout(settings["read_timeout"], connect=settings["connect_timeout"])
+    return limits, timeout
+
+
+def get_http_clients():
+    # lazily build the sync + async pooled http clients (shared by every model)
+    global _http_client, _http_async_client
+    with _lock:
+        if _http_client is None:
+            limits, timeout = _pool_config()
+            _http_client = httpx.Client(limits=limits, timeout=timeout)
+            _http_async_client = httpx.AsyncClient(limits=limits, timeout=timeout)
+    return _http_client, _http_async_client
+
+
+def get_llm(model=None, temperature=0, **settings):
+    # returns the same ChatOpenAI for the same model + settings
+    model = model or get_openrouter_model()
+    if _llm_factory is not None:
+        return _llm_factory(model, temperature, **settings)
+    key = (model, temperature, tuple(sorted(settings.items())))
+
+    llm = _clients.get(key)
+    if llm is not None:
+        return llm
+
+    http_client, http_async_client = get_http_clients()
+    with _lock:
+        llm = _clients.get(key)
+        if llm is None:
+            llm = ChatOpenAI(
+                model=model,
+                temperature=temperature,  # 0 keeps it deterministic
+                api_key=get_openrouter_api_key(),
+                base_url=OPENROUTER_BASE_URL,
+                default_headers=DEFAULT_HEADERS,
+                http_client=http_client,
+                http_async_client=http_async_client,
+                stream_usage=True,  # so streamed calls still report token usage
+                max_retries=0,  # call_llm does its own retries (agents/resilience.py)
+                **settings
+            )
+            _clients[key] = llm
+    return llm
+
+
+def _cache_key(agent, messages, model, temperature, max_tokens=None):
+    # only deterministic calls are safe to cache
+    if temperature != 0:
+        return None
+    return make_cache_key(model, agent, messages, max_tokens)
+
+
+def _cached(content):
+    if content is None:
+        return None
+    return AIMessage(content=content, response_metadata={"cached": True})
+
+
+def _cache_lookup(agent, messages, model, temperature, max_tokens=None):
+    key = _cache_key(agent, messages, model, temperature, max_tokens)
+    return key, _cached(get_response_cache().get(key) if key else None)
+
+
+async def _acache_lookup(agent, messages, model, temperature, max_tokens=None):
+    # the sqlite tier reads the disk, so it's awaited off the event loop
+    key = _cache_key(agent, messages, model, temperature, max_tokens)
+    return key, _cached(await get_response_cache().aget(key) if key else None)
+
+
+def _complete(response):
+    # an answer cut off at max_tokens isn't worth keeping
+    return (response.response_metadata or {}).get("finish_reason") != "length"
+
+
+def _stream(llm, messages):
+    # stream and stitch the chunks back together, so we get time-to-first-token
+    # (and token events for /generate/stream) for free
+    started = time.perf_counter()
+    ttft = None
+    response = None
+    for chunk in llm.stream(messages):
+        if ttft is None:
+            ttft = time.perf_counter() - started
+        response = chunk if response is None else response + chunk
+    return response or AIMessage(content=""), ttft
+
+
+async def _astream(llm, messages):
+    started = time.perf_counter()
+    ttft = None
+    response = None
+    async for chunk in llm.astream(messages):
+        if ttft is None:
+            ttft = time.perf_counter() - started
+        response = chunk if response is None else response + chunk
+    return response or AIMessage(content=""), ttft
+
+
+def model_chain(agent, overrides=None, **explicit):
+    # the models to try for one call, in order: the agent's configured model
+    # (with any per-request overrides) and then its fallbacks
+    settings = get_agent_llm_settings(agent)
+    settings.update({k: v for k, v in ((overrides or {}).get(agent) or {}).items() if v is not None})
+    settings.update({k: v for k, v in explicit.items() if v is not None})
+
+    base = {k: v for k, v in settings.items() if k not in ("model", "fallbacks")}
+    # every call gets a timeout, LLM_CALL_TIMEOUT unless the agent has its own
+    base["timeout"] = base.get("timeout") or get_retry_settings()["call_timeout"] or None
+    models = [settings["model"]] + [m for m in settings.get("fallbacks") or [] if m != settings["model"]]
+    return [{"model": model, **base} for model in models]
+
+
+def _llm_settings(options):
+    # ChatOpenAI kwargs for one attempt (model + temperature go positionally)
+    extra = {}
+    if options.get("max_tokens"):
+        extra["max_tokens"] = options["max_tokens"]
+    if options.get("timeout"):
+        extra["timeout"] = options["timeout"]
+    return extra
+
+
+def _should_fall_back(e):
+    # a bad api key fails the same way on every model, no point trying them all
+    try:
+        import openai
+        return not isinstance(e, openai.AuthenticationError)
+    except ImportError:
+        return True
+
+
+def _fit_prompt(agent, messages):
+    # measure the prompt and make sure it fits PROMPT_TOKEN_BUDGET
+    fitted, tokens = fit_messages(messages)
+    record_prompt_size(agent, tokens, truncated=fitted is not messages)
+    if fitted is not messages:
+        log.warning("prompt over the token budget, truncated", extra={"agent": agent, "tokens": tokens})
+    return fitted, tokens
+
+
+def _reserve(model, prompt_tokens, options):
+    # queue for the model's rate limiter, (seconds to wait, tokens reserved)
+    try:
+        wait, reserved = reserve_call(model, prompt_tokens, options.get("max_tokens"))
+    except RateLimitWaitTooLong:
+        record_rate_limited(model)
+        raise
+    if wait:
+        record_rate_limit_wait(model, wait)
+    return wait, reserved
+
+
+def _call_once(agent, messages, options, prompt_tokens=None):
+    model, temperature = options["model"], options.get("temperature", 0)
+    key, cached = _cache_lookup(agent, messages, model, temperature, options.get("max_tokens"))
+    if cached is not None:
+        record_llm_call(agent, model, cached, cached=True, estimated_prompt_tokens=prompt_tokens)
+        return cached
+
+    wait, reserved = _reserve(model, prompt_tokens, options)
+    try:
+        if wait:
+            time.sleep(wait)
+        response, ttft = _stream(get_llm(model, temperature, **_llm_settings(options)), messages)
+    except BaseException as e:
+        # otherwise every failed attempt (and its retries) keeps a full reservation
+        refund_call(model, reserved)
+        if options.get("timeout") and is_timeout(e):
+            raise ModelTimeout(model, options["timeout"]) from e
+        raise
+    settle_call(model, reserved, response)
+    record_llm_call(agent, model, response, ttft, estimated_prompt_tokens=prompt_tokens)
+    if key is not None and _complete(response):
+        get_response_cache().set(key, response.content)
+    return response
+
+
+async def _acall_once(agent, messages, options, prompt_tokens=None):
+    model, temperature = options["model"], options.get("temperature", 0)
+    key, cached = await _acache_lookup(agent, messages, model, temperature, options.get("max_tokens"))
+    if cached is not None:
+        record_llm_call(agent, model, cached, cached=True, estimated_prompt_tokens=prompt_tokens)
+        return cached
+
+    wait, reserved = _reserve(model, prompt_tokens, options)
+    try:
+        if wait:
+            await asyncio.sleep(wait)
+        llm = get_llm(model, temperature, **_llm_settings(options))
+        # the timeout covers the whole streamed answer, not just each read
+        response, ttft = await asyncio.wait_for(_astream(llm, messages), options.get("timeout"))
+    except BaseException as e:
+        refund_call(model, reserved)  # cancelled or timed out counts too
+        if options.get("timeout") and is_timeout(e):
+            raise ModelTimeout(model, options["timeout"]) from e
+        raise
+    settle_call(model, reserved, response)
+    record_llm_call(agent, model, response, ttft, estimated_prompt_tokens=prompt_tokens)
+    if key is not None and _complete(response):
+        await get_response_cache().aset(key, response.content)
+    return response
+
+
+def _failed_attempt(agent, model, breaker, e, attempt):
+    # bookkeeping for a failed call, returns how long to wait before retrying (None = don't)
+    if isinstance(e, RateLimitWaitTooLong):
+        return None  # never reached the model, try the fallback
+    if isinstance(e, ModelTimeout):
+        # counts against the model, but retrying it would just wait out the timeout again
+        if breaker.record_failure():
+            record_circuit_opened(model)
+        log.warning("llm call timed out", extra={"agent": agent, "model": model, "timeout": e.timeout})
+        return None
+    if not is_retryable(e):
+        breaker.record_success()  # the model answered, the request was the problem
+        return None
+    if breaker.record_failure():
+        record_circuit_opened(model)
+        log.warning("too many errors, circuit open", extra={"agent": agent, "model": model})
+        return None
+    if breaker.state != "closed":
+        # a failed half-open trial, or another call already opened it - don't
+        # keep hammering the model, move on to the fallback
+        return None
+    delay = retry_delay(e, attempt)
+    if delay is not None:
+        record_retry(agent, model)
+        log.warning("llm call failed, retrying",
+                    extra={"agent": agent, "model": model, "error": repr(e), "delay": round(delay, 2)})
+    return delay
+
+
+def _call_with_retries(agent, messages, options, prompt_tokens):
+    breaker = get_breaker(options["model"])
+    attempt = 0
+    while True:
+        try:
+            response = _call_once(agent, messages, options, prompt_tokens)
+            breaker.record_success()
+            return response
+        except Exception as e:
+            delay = _failed_attempt(agent, options["model"], breaker, e, attempt)
+            if delay is None:
+                raise
+        time.sleep(delay)
+        attempt += 1
+
+
+async def _acall_with_retries(agent, messages, options, prompt_tokens):
+    breaker = get_breaker(options["model"])
+    attempt = 0
+    while True:
+        try:
+            response = await _acall_once(agent, messages, options, prompt_tokens)
+            breaker.record_success()
+            return response
+        except Exception as e:
+            delay = _failed_attempt(agent, options["model"], breaker, e, attempt)
+            if delay is None:
+                raise
+        await asyncio.sleep(delay)
+        attempt += 1
+
+
+def _open_circuit(agent, options):
+    # CircuitOpenError if this model's circuit is open, else None
+    breaker = get_breaker(options["model"])
+    if breaker.allow():
+        return None
+    log.warning("circuit open, skipping the model", extra={"agent": agent, "model": options["model"]})
+    return CircuitOpenError(options["model"], breaker.retry_in())
+
+
+def call_llm(agent, messages, overrides=None, **explicit):
+    # the one path every agent uses to talk to the llm
+    # overrides = per-request {agent: settings}, explicit = model/temperature/... for this call
+    # each model is retried on transient errors, then we move down the fallbacks
+    chain = model_chain(agent, overrides, **explicit)
+    messages, prompt_tokens = _fit_prompt(agent, messages)
+    error = None
+    for i, options in enumerate(chain):
+        error = _open_circuit(agent, options)
+        if error is not None:
+            continue
+        try:
+            return _call_with_retries(agent, messages, options, prompt_tokens)
+        except Exception as e:
+            if i == len(chain) - 1 or not _should_fall_back(e):
+                raise
+            error = e
+            log.warning("llm call failed, trying the fallback", extra={
+                "agent": agent, "model": options["model"], "fallback": chain[i + 1]["model"], "error": repr(e)
+            })
+    raise error
+
+
+async def acall_llm(agent, messages, overrides=None, **explicit):
+    chain = model_chain(agent, overrides, **explicit)
+    messages, prompt_tokens = _fit_prompt(agent, messages)
+    error = None
+    for i, options in enumerate(chain):
+        error = _open_circuit(agent, options)
+        if error is not None:
+            continue
+        try:
+            return await _acall_with_retries(agent, messages, options, prompt_tokens)
+        except Exception as e:
+            if i == len(chain) - 1 or not _should_fall_back(e):
+                raise
+            error = e
+            log.warning("llm call failed, trying the fallback", extra={
+                "agent": agent, "model": options["model"], "fallback": chain[i + 1]["model"], "error": repr(e)
+            })
+    raise error
+
+
+def response_tokens(response):
+    # total tokens the call used (0 for cache hits or providers that don't say)
+    usage = getattr(response, "usage_metadata", None) or {}
+    return usage.get("total_tokens", 0)
+
+
+def set_llm_factory(factory):
+    # use factory(model, temperature, **settings) -> chat model instead of
+    # OpenRouter, e.g. the fake backend in benchmarks/. None goes back to normal
+    global _llm_factory
+    _llm_factory = factory
+
+
+_closing = set()  # aclose() tasks still running, so they aren't garbage collected
+
+
+def reset_llm_clients():
+    # drop everything, e.g. after the api key or pool settings change
+    global _http_client, _http_async_client
+    with _lock:
+        _clients.clear()
+        if _http_client is not None:
+            _http_client.close()
+        async_client = _http_async_client
+        _http_client = None
+        _http_async_client = None
+    if async_client is not None:
+        _close_async_client(async_client)
+
+
+def _close_async_client(client):
+    # the async pool can only be closed with await. inside a running loop that's
+    # a task on it, outside one a short asyncio.run
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+    if loop is not None:
+        task = loop.create_task(client.aclose())
+        _closing.add(task)
+        task.add_done_callback(_closing.discard)
+        return
+    try:
+        asyncio.run(client.aclose())
+    except Exception as e:
+        # its connections belonged to a loop that is gone, nothing left to close cleanly
+        log.warning("could not close the async http client", extra={"error": str(e)})
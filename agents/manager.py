@@ -1,36 +1,30 @@
-from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage
-from config import get_openrouter_api_key, get_openrouter_model
-
-def get_llm():
-    return ChatOpenAI(
-        model=get_openrouter_model(),
-        temperature=0,
-        api_key=get_openrouter_api_key(),
-        base_url="https://openrouter.ai/api/v1",
-        default_headers={
-            "HTTP-Referer": "https://github.com/your-repo",
-            "X-Title": "Codecraft AI"
-        }
-    )
+from agents.llm import call_llm, acall_llm, response_tokens
+from agents.decision import local_decision
+from agents.sandbox import render_test_results
+from logs import get_logger
 
-def manager_agent(state):
-    print("\n[MANAGER] AGENT STARTED")
+log = get_logger(__name__)
+
+def _test_summary(state):
+    results = render_test_results(state.get("test_results"))
+    return f"\nTest results:\n{results}\n" if results else ""
 
-    llm = get_llm()
+def _manager_messages(state):
     # manager makes the final call
-    response = llm.invoke([
+    return [
         HumanMessage(content=f"""You are a software manager.
 
 Review:
 {state['review']}
-
+{_test_summary(state)}
 Reply with ONLY one word:
 - rewrite
 - approve
 """)
-    ])
+    ]
 
+def _manager_result(response):
     decision = response.content.lower().strip()
 
     # parse the decision
@@ -39,5 +33,36 @@ Reply with ONLY one word:
     else:
         final_decision = "approve"  # default to approve
 
-    print("FINAL DECISION:", final_decision)
-    return {"decision": final_decision}
+    log.info("decision made", extra={"decision": final_decision, "source": "llm"})
+    return {"decision": final_decision, "decision_source": "llm", "tokens_used": response_tokens(response)}
+
+def _local_result(state):
+    # skip the llm call when the review already makes the answer clear
+    local = local_decision(state.get("review"), state.get("decision_strategy"))
+    if local is None:
+        return None
+    decision, confidence, source = local
+    results = state.get("test_results")
+    if decision == "approve" and results and results["status"] in ("failed", "error", "timeout"):
+        # the review looks fine but the tests don't pass, let the llm weigh both
+        return None
+    log.info("decision made", extra={"decision": decision, "source": source, "confidence": confidence})
+    return {"decision": decision, "decision_source": source, "tokens_used": 0}
+
+def manager_agent(state):
+    log.info("manager started")
+
+    local = _local_result(state)
+    if local is not None:
+        return local
+    response = call_llm("manager", _manager_messages(state), state.get("llm_overrides"))
+    return _manager_result(response)
+
+async def manager_agent_async(state):
+    log.info("manager started")
+
+    local = _local_result(state)
+    if local is not None:
+        return local
+    response = await acall_llm("manager", _manager_messages(state), state.get("llm_overrides"))
+    return _manager_result(response)
@@ -0,0 +1,176 @@
+# prompt size management
+# prompts are measured before they're sent, and anything over the budget gets
+# shrunk: boilerplate dropped, long text condensed, big code reviewed in chunks.
+# keeps latency (and cost) predictable as generated projects get bigger
+import ast
+import re
+
+from config import get_prompt_budget_settings
+from agents.edits import _segment
+from agents.schemas import architecture_brief
+
+_encoding = None
+_encoding_loaded = False
+
+
+def _get_encoding():
+    # tiktoken comes with langchain-openai, but fall back to a rough count without it
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        _encoding_loaded = True
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding(get_prompt_budget_settings()["encoding"])
+        except Exception:
+            _encoding = None
+    return _encoding
+
+
+def count_tokens(text):
+    text = text or ""
+    encoding = _get_encoding()
+    if encoding is None:
+        return len(text) // 4 + 1  # ~4 characters per token for english/code
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def message_tokens(messages):
+    # content plus a few tokens of per-message overhead
+    return sum(count_tokens(str(message.content)) + 4 for message in messages)
+
+
+def prompt_budget():
+    return get_prompt_budget_settings()["max_prompt_tokens"]
+
+
+def truncate_tokens(text, max_tokens, marker="\n... [truncated] ...\n"):
+    # keep the start and the end, cut the middle
+    if count_tokens(text) <= max_tokens:
+        return text
+    encoding = _get_encoding()
+    if encoding is None:
+        keep = max(max_tokens * 4 - len(marker), 0) // 2
+        return text[:keep] + marker + text[-keep:] if keep else marker
+    tokens = encoding.encode(text, disallowed_special=())
+    keep = max(max_tokens - count_tokens(marker), 0) // 2
+    if not keep:
+        return marker
+    return encoding.decode(tokens[:keep]) + marker + encoding.decode(tokens[-keep:])
+
+
+def strip_boilerplate(code):
+    # drop comment-only lines, docstrings and blank lines - the reviewer and
+    # tester don't need them to follow the logic
+    def strip_docstrings(source):
+        try:
+            tree = ast.parse(source)
+        except SyntaxError:
+            return source
+        lines = source.splitlines()
+        drop = set()
+        for node in ast.walk(tree):
+            if isinstance(node, (ast.Module, ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)):
+                body = getattr(node, "body", [])
+                if body and isinstance(body[0], ast.Expr) and isinstance(getattr(body[0], "value", None), ast.Constant) \
+                        and isinstance(body[0].value.value, str) and len(body) > 1:
+                    drop.update(range(body[0].lineno - 1, body[0].end_lineno))
+        return "\n".join(line for i, line in enumerate(lines) if i not in drop)
+
+    def strip_block(source):
+        source = strip_docstrings(source)
+        kept = [line for line in source.splitlines() if line.strip() and not line.strip().startswith("#")]
+        return "\n".join(kept)
+
+    # keep the markdown/file structure, only touch what's inside python fences
+    if "```" in (code or ""):
+        return re.sub(
+            r"(```(?:python|py)?\n)(.*?)(```)",
+            lambda m: m.group(1) + strip_block(m.group(2)) + "\n" + m.group(3),
+            code, flags=re.DOTALL
+        )
+    return strip_block(code or "")
+
+
+def condense_text(text, max_tokens):
+    # extractive summary: headings and bullet points first, then the rest,
+    # stopping once we're at the budget
+    if count_tokens(text) <= max_tokens:
+        return text
+    lines = (text or "").splitlines()
+    important = {i for i, line in enumerate(lines)
+                 if re.match(r"\s*(#{1,6} |[-*+] |\d+[.)] )", line)}
+    picked = set()
+    used = 0
+    for group in (sorted(important), [i for i in range(len(lines)) if i not in important]):
+        for i in group:
+            cost = count_tokens(lines[i]) + 1
+            if used + cost > max_tokens:
+                break
+            picked.add(i)
+            used += cost
+    condensed = "\n".join(lines[i] for i in sorted(picked))
+    return condensed or truncate_tokens(text, max_tokens)
+
+
+def _python_units(source):
+    # top-level statements grouped so each def/class stays in one piece
+    try:
+        tree = ast.parse(source)
+    except SyntaxError:
+        return source.splitlines()
+    lines = source.splitlines()
+    return [_segment(lines, node) for node in tree.body]
+
+
+def split_code_chunks(code, max_tokens):
+    # split code into pieces that each fit max_tokens, along file and
+    # function boundaries where possible
+    files = re.findall(r"(# file: \S+\n)?```(?:python|py)?\n(.*?)```", code or "", re.DOTALL)
+    if not files:
+        files = [("", code or "")]
+
+    chunks = []
+    for header, source in files:
+        current = []
+        used = count_tokens(header)
+        for unit in _python_units(source):
+            cost = count_tokens(unit) + 1
+            if current and used + cost > max_tokens:
+                chunks.append(f"{header}```python\n" + "\n\n".join(current) + "\n```")
+                current, used = [], count_tokens(header)
+            current.append(truncate_tokens(unit, max_tokens) if cost > max_tokens else unit)
+            used += min(cost, max_tokens)
+        if current:
+            chunks.append(f"{header}```python\n" + "\n\n".join(current) + "\n```")
+    return chunks
+
+
+def compact_code(code):
+    # code/tests for the tester and reviewer: as is if it fits, else without boilerplate
+    budget = prompt_budget()
+    if not budget or count_tokens(code) <= budget // 2:
+        return code
+    return strip_boilerplate(code)
+
+
+def compact_architecture(state):
+    # the architecture brief, condensed if it's long
+    brief = architecture_brief(state)
+    limit = get_prompt_budget_settings()["architecture_tokens"]
+    return condense_text(brief, limit) if limit else brief
+
+
+def fit_messages(messages, max_tokens=None):
+    # last line of defence in call_llm: if a prompt is still too big, cut the
+    # middle out of the longest message until it fits. (messages, prompt tokens)
+    max_tokens = max_tokens or prompt_budget()
+    total = message_tokens(messages)
+    if not max_tokens or total <= max_tokens:
+        return messages, total
+
+    messages = list(messages)
+    longest = max(range(len(messages)), key=lambda i: len(str(messages[i].content)))
+    content = str(messages[longest].content)
+    allowed = max(count_tokens(content) - (total - max_tokens), 16)
+    messages[longest] = messages[longest].model_copy(update={"content": truncate_tokens(content, allowed)})
+    return messages, message_tokens(messages)
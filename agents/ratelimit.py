@@ -0,0 +1,143 @@
+# client-side rate limiting per model
+# without this every concurrent run hits openrouter at once and they all trip
+# the provider's limits together. each call reserves one request and its
+# expected tokens from the model's buckets first and waits its turn; if the
+# wait would be longer than RATE_LIMIT_MAX_WAIT we give up with a 429 instead
+import threading
+import time
+
+from config import get_rate_limit_settings
+
+
+class RateLimitWaitTooLong(RuntimeError):
+    # the limiter queue for a model is longer than we're willing to wait
+
+    def __init__(self, model, wait):
+        super().__init__(f"Rate limit for model '{model}' reached, next slot in {wait:.1f}s")
+        self.model = model
+        self.wait = wait
+
+
+class TokenBucket:
+    # refills at per_minute/60 per second, holds at most a minute's worth.
+    # taking more than is there leaves it negative - that's the queue
+
+    def __init__(self, per_minute):
+        self.rate = per_minute / 60.0
+        self.capacity = per_minute
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_for(self, amount):
+        # seconds until `amount` is available (one call can't need more than a full bucket)
+        return max(0.0, (min(amount, self.capacity) - self.level) / self.rate)
+
+    def take(self, amount):
+        self.level -= min(amount, self.capacity)
+
+    def give_back(self, amount):
+        self.level = min(self.capacity, self.level + amount)
+
+
+class ModelLimiter:
+    # requests-per-minute and tokens-per-minute buckets for one model
+
+    def __init__(self, model, rpm=0, tpm=0, max_wait=30.0):
+        self.model = model
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+        self._requests = TokenBucket(rpm) if rpm else None
+        self._tokens = TokenBucket(tpm) if tpm else None
+
+    def _buckets(self):
+        return [bucket for bucket in (self._requests, self._tokens) if bucket is not None]
+
+    def _wait(self, tokens):
+        now = time.monotonic()
+        for bucket in self._buckets():
+            bucket.refill(now)
+        waits = [self._requests.wait_for(1) if self._requests else 0.0,
+                 self._tokens.wait_for(tokens) if self._tokens else 0.0]
+        return max(waits)
+
+    def estimate_wait(self, tokens=1):
+        # how long a call would queue right now, without reserving anything
+        with self._lock:
+            return self._wait(tokens)
+
+    def reserve(self, tokens):
+        # seconds to wait before making the call, RateLimitWaitTooLong if too long
+        with self._lock:
+            wait = self._wait(tokens)
+            if self.max_wait and wait > self.max_wait:
+                raise RateLimitWaitTooLong(self.model, wait)
+            if self._requests:
+                self._requests.take(1)
+            if self._tokens:
+                self._tokens.take(tokens)
+            return wait
+
+    def settle(self, reserved, used):
+        # swap the token estimate for what the call really used
+        if self._tokens is None or not used:
+            return
+        with self._lock:
+            if used < reserved:
+                self._tokens.give_back(reserved - used)
+            else:
+                self._tokens.take(used - reserved)
+
+    def refund(self, reserved):
+        # the call failed before using its tokens, the request still counts
+        if self._tokens is None or not reserved:
+            return
+        with self._lock:
+            self._tokens.give_back(reserved)
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(model):
+    # None if the model has no limits configured
+    with _limiters_lock:
+        if model not in _limiters:
+            settings = get_rate_limit_settings(model)
+            _limiters[model] = None
+            if settings["rpm"] or settings["tpm"]:
+                _limiters[model] = ModelLimiter(model, settings["rpm"], settings["tpm"], settings["max_wait"])
+        return _limiters[model]
+
+
+def reserve_call(model, prompt_tokens, max_tokens=None):
+    # (seconds to wait, tokens reserved) for one call to model
+    limiter = get_limiter(model)
+    if limiter is None:
+        return 0.0, 0
+    tokens = (prompt_tokens or 0) + (max_tokens or get_rate_limit_settings(model)["completion_estimate"])
+    return limiter.reserve(tokens), tokens
+
+
+def settle_call(model, reserved, response):
+    limiter = get_limiter(model)
+    if limiter is not None and reserved:
+        usage = getattr(response, "usage_metadata", None) or {}
+        limiter.settle(reserved, usage.get("total_tokens", 0))
+
+
+def refund_call(model, reserved):
+    # give back what reserve_call took for a call that failed (timeout, error, cancelled)
+    limiter = get_limiter(model)
+    if limiter is not None:
+        limiter.refund(reserved)
+
+
+def admission_wait(model):
+    # how long a new run's first call would queue, for admission control in the api
+    limiter = get_limiter(model)
+    return limiter.estimate_wait() if limiter else 0.0
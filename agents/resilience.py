@@ -0,0 +1,182 @@
+# retries and circuit breakers for llm calls
+# a 429 or a dropped connection from openrouter used to fail the whole run.
+# now each call is retried a few times with backoff (honouring Retry-After),
+# and a model that keeps failing gets its circuit opened so calls go straight
+# to the agent's fallback model instead of waiting on it
+import asyncio
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import httpx
+
+from config import get_retry_settings
+
+
+class CircuitOpenError(RuntimeError):
+    # the model failed too often recently, we're not calling it for a while
+
+    def __init__(self, model, retry_in):
+        super().__init__(f"Circuit open for model '{model}', retry in {retry_in:.0f}s")
+        self.model = model
+        self.retry_in = retry_in
+
+
+class ModelTimeout(TimeoutError):
+    # the model took longer than the agent's own timeout. not retried on the same
+    # model - a slow model stays slow - the call moves on to the fallback
+
+    def __init__(self, model, timeout):
+        super().__init__(f"Model '{model}' took longer than {timeout:g}s")
+        self.model = model
+        self.timeout = timeout
+
+
+def is_timeout(e):
+    if isinstance(e, (asyncio.TimeoutError, TimeoutError, httpx.TimeoutException)):
+        return True
+    try:
+        import openai
+        return isinstance(e, openai.APITimeoutError)
+    except ImportError:
+        return False
+
+
+def is_retryable(e):
+    # transient provider trouble - rate limits, timeouts, dropped connections, 5xx
+    if isinstance(e, (asyncio.TimeoutError, TimeoutError, httpx.TransportError)):
+        return True
+    if "insufficient_quota" in str(e):
+        return False  # a 429 too, but waiting won't add credits
+    try:
+        import openai
+        if isinstance(e, (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)):
+            return True
+    except ImportError:
+        pass
+    status = getattr(e, "status_code", None)
+    return status in (408, 409, 429) or (status or 0) >= 500
+
+
+def retry_after(e):
+    # seconds the provider asked us to wait, None if it didn't say
+    response = getattr(e, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    if headers.get("retry-after-ms"):
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt, base_delay, max_delay):
+    # "full jitter" so retries from many runs don't all land at once
+    return random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+
+
+def retry_delay(e, attempt, settings=None):
+    # seconds to wait before retrying after the attempt-th failure, None to give up
+    settings = settings or get_retry_settings()
+    if attempt >= settings["max_retries"] or not is_retryable(e):
+        return None
+    wait = retry_after(e)
+    if wait is None:
+        return backoff_delay(attempt, settings["base_delay"], settings["max_delay"])
+    if wait > settings["max_delay"]:
+        return None  # asked to go away for a while, better try the fallback model
+    return wait
+
+
+class CircuitBreaker:
+    # closed -> open after `failures` transient errors in a row; open -> half
+    # open after `reset_seconds`, where one trial call decides whether it closes
+
+    def __init__(self, failures=5, reset_seconds=30.0):
+        self.failures = failures
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self._errors = 0
+        self._opened_at = None
+        self._trial_at = None
+
+    @property
+    def state(self):
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at < self.reset_seconds:
+            return "open"
+        return "half_open"
+
+    def retry_in(self):
+        if self._opened_at is None:
+            return 0.0
+        return max(self.reset_seconds - (time.monotonic() - self._opened_at), 0.0)
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "open":
+                return False
+            # half open: one trial call at a time (a stuck trial counts as done after reset_seconds)
+            now = time.monotonic()
+            if self._trial_at is None or now - self._trial_at > self.reset_seconds:
+                self._trial_at = now
+                return True
+            return False
+
+    def record_success(self):
+        # the model answered (even an error like a bad request counts)
+        with self._lock:
+            self._errors = 0
+            self._opened_at = None
+            self._trial_at = None
+
+    def record_failure(self):
+        # returns True if this failure opened the circuit
+        with self._lock:
+            self._errors += 1
+            self._trial_at = None
+            if self._opened_at is not None:
+                self._opened_at = time.monotonic()  # failed trial, stay open
+                return False
+            if self.failures and self._errors >= self.failures:
+                self._opened_at = time.monotonic()
+                return True
+            return False
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(model):
+    # one breaker per model, shared by every agent using it
+    with _breakers_lock:
+        breaker = _breakers.get(model)
+        if breaker is None:
+            settings = get_retry_settings()
+            breaker = _breakers[model] = CircuitBreaker(
+                settings["circuit_failures"], settings["circuit_reset_seconds"]
+            )
+        return breaker
+
+
+def breaker_states():
+    # models whose circuit isn't closed, for /status
+    with _breakers_lock:
+        breakers = dict(_breakers)
+    return {model: breaker.state for model, breaker in breakers.items() if breaker.state != "closed"}
@@ -1,37 +1,133 @@
-from langchain_openai import ChatOpenAI
+import asyncio
+
 from langchain_core.messages import HumanMessage
-from config import get_openrouter_api_key, get_openrouter_model
-
-def get_llm():
-    return ChatOpenAI(
-        model=get_openrouter_model(),
-        temperature=0,
-        api_key=get_openrouter_api_key(),
-        base_url="https://openrouter.ai/api/v1",
-        default_headers={
-            "HTTP-Referer": "https://github.com/your-repo",
-            "X-Title": "Codecraft AI"
-        }
-    )
+from agents.llm import call_llm, acall_llm, response_tokens
+from agents.decision import VERDICT_INSTRUCTION, VERDICT_LINE, structured_decision
+from agents.prompt_budget import compact_code, message_tokens, prompt_budget, split_code_chunks
+from agents.sandbox import render_test_results
+from agents.schemas import (
+    ReviewerOutput, parse_structured, render_review, structured_instruction, wants_structured
+)
+from logs import body, get_logger
 
-def reviewer_agent(state):
-    print("\n[REVIEWER] AGENT STARTED")
+log = get_logger(__name__)
+
+def _output_format(state):
+    if wants_structured(state):
+        return structured_instruction(ReviewerOutput)
+    return VERDICT_INSTRUCTION
 
-    llm = get_llm()
-    # review both code and tests
-    response = llm.invoke([
-        HumanMessage(content=f"""Review this code and tests. 
+def _review_messages(state, code, tests=None, part=None):
+    # tests=None is a code-only review, part=(i, n) for one chunk of a big project
+    what = "code" if tests is None else "code and tests"
+    intro = f"Review this {what}. "
+    if part:
+        intro = f"Review this {what}. It is part {part[0]} of {part[1]} of a larger project, the other parts are reviewed separately. "
+    prompt = f"""{intro}
 Say if changes are required or not.
 
 Code:
-{state['code']}
-
+{code}
+"""
+    if tests is not None:
+        prompt += f"""
 Tests:
-{state['tests']}
-""")
-    ])
+{tests}
+"""
+    results = render_test_results(state.get("test_results"))
+    if tests is not None and results:
+        # real results, so the review doesn't have to guess whether the code works
+        prompt += f"""
+We ran the tests with pytest:
+{results}
+"""
+    return [HumanMessage(content=prompt + f"\n{_output_format(state)}\n")]
+
+def _review_prompts(state, code_only=False):
+    # usually one prompt. when the code doesn't fit PROMPT_TOKEN_BUDGET it's
+    # split along files/functions and each chunk is reviewed on its own
+    code = compact_code(state["code"])
+    tests = None if code_only else compact_code(state["tests"])
+    messages = _review_messages(state, code, tests)
+    budget = prompt_budget()
+    if not budget or message_tokens(messages) <= budget:
+        return [messages]
+
+    overhead = message_tokens(_review_messages(state, "", tests, part=(1, 1)))
+    if tests is not None and overhead > budget // 2:
+        # too big to repeat in every chunk, review the code on its own
+        tests = None
+        overhead = message_tokens(_review_messages(state, "", None, part=(1, 1)))
+    chunks = split_code_chunks(code, max(budget - overhead, budget // 4))
+    if len(chunks) < 2:
+        return [messages]  # can't split it, call_llm will truncate
+    log.info("code over the prompt budget, reviewing it in chunks", extra={"chunks": len(chunks)})
+    return [_review_messages(state, chunk, tests, part=(i + 1, len(chunks))) for i, chunk in enumerate(chunks)]
+
+def _parse_review(state, response):
+    spec = parse_structured(response.content, ReviewerOutput) if wants_structured(state) else None
+    return (render_review(spec) if spec else response.content), spec
+
+def _merge_reviews(state, responses):
+    # one review out of the per-chunk ones
+    parsed = [_parse_review(state, response) for response in responses]
+    if len(parsed) == 1:
+        return parsed[0]
+
+    specs = [spec for _, spec in parsed]
+    if all(specs):
+        spec = ReviewerOutput(
+            summary=" ".join(s.summary for s in specs),
+            issues=[issue for s in specs for issue in s.issues],
+            changes_required=any(s.changes_required for s in specs)
+        )
+        return render_review(spec), spec
+
+    verdicts = [structured_decision(review) for review, _ in parsed]
+    parts = [VERDICT_LINE.sub("", review).strip() for review, _ in parsed]
+    review = "\n\n".join(f"Part {i + 1}:\n{part}" for i, part in enumerate(parts))
+    if any(v and v[0] == "rewrite" for v in verdicts):
+        review += "\n\nCHANGES_REQUIRED: yes"
+    elif all(v and v[0] == "approve" for v in verdicts):
+        review += "\n\nCHANGES_REQUIRED: no"
+    return review, None
+
+def _reviewer_result(state, responses):
+    review, spec = _merge_reviews(state, responses)
+    log.info("review written", extra={"output": body(review)})
+
+    return {
+        "review": review,
+        "review_spec": spec.model_dump() if spec else None,
+        "tokens_used": sum(response_tokens(response) for response in responses)
+    }
+
+def _review(state, code_only=False):
+    overrides = state.get("llm_overrides")
+    responses = [call_llm("reviewer", messages, overrides) for messages in _review_prompts(state, code_only)]
+    return _reviewer_result(state, responses)
+
+async def _areview(state, code_only=False):
+    # chunks are reviewed concurrently
+    overrides = state.get("llm_overrides")
+    responses = await asyncio.gather(*(
+        acall_llm("reviewer", messages, overrides) for messages in _review_prompts(state, code_only)
+    ))
+    return _reviewer_result(state, list(responses))
+
+def reviewer_agent(state):
+    log.info("reviewer started")
+    return _review(state)
+
+async def reviewer_agent_async(state):
+    log.info("reviewer started")
+    return await _areview(state)
 
-    review = response.content
-    print("REVIEW FEEDBACK:\n", review)
+def code_reviewer_agent(state):
+    # code-only review, so it can run while the tester is still writing tests
+    log.info("reviewer started", extra={"code_only": True})
+    return _review(state, code_only=True)
 
-    return {"review": review}
+async def code_reviewer_agent_async(state):
+    log.info("reviewer started", extra={"code_only": True})
+    return await _areview(state, code_only=True)
@@ -0,0 +1,200 @@
+# runs the generated tests against the generated code
+# the reviewer used to judge the code just by reading it. now the code and
+# tests are written to a temp dir and pytest runs in a separate python
+# process with cpu/memory/time limits, and the reviewer gets the results.
+# a small pool of workers caps how many of these run at once
+import asyncio
+import importlib.util
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+
+from config import get_sandbox_settings
+from agents.edits import extract_python
+from agents.schemas import wants_structured
+from logs import get_logger
+
+log = get_logger(__name__)
+
+# sets the limits inside the child, then runs pytest. resource is unix only,
+# elsewhere only the timeout applies
+LAUNCHER = """
+import runpy, sys
+cpu, memory = int(sys.argv[1]), int(sys.argv[2])
+try:
+    import resource
+    if cpu:
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu + 1))
+    if memory:
+        resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+    resource.setrlimit(resource.RLIMIT_FSIZE, (64 * 1024 * 1024, 64 * 1024 * 1024))
+except (ImportError, ValueError, OSError):
+    pass
+sys.argv = ["pytest"] + sys.argv[3:]
+runpy.run_module("pytest", run_name="__main__")
+"""
+
+IMPORTED_MODULE = re.compile(r"^\s*(?:from\s+([\w.]+)\s+import|import\s+([\w.]+))", re.MULTILINE)
+
+_pool = None
+_has_pytest = None
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=get_sandbox_settings()["workers"], thread_name_prefix="sandbox")
+    return _pool
+
+
+def pytest_available():
+    # without pytest every run would come back as an error, which reads as
+    # failing tests to the reviewer, manager and best-of-N scoring
+    global _has_pytest
+    if _has_pytest is None:
+        _has_pytest = importlib.util.find_spec("pytest") is not None
+        if not _has_pytest:
+            log.warning("pytest isn't installed, the generated tests won't be run")
+    return _has_pytest
+
+
+def wants_execution(state):
+    # per request setting, falls back to SANDBOX_ENABLED
+    value = state.get("execute_tests")
+    wanted = get_sandbox_settings()["enabled"] if value is None else value
+    return wanted and pytest_available()
+
+
+def _safe_path(path, default):
+    # keep files inside the workspace
+    path = os.path.normpath(path or default).lstrip("/\\")
+    return default if path.startswith("..") or not path.endswith(".py") else path
+
+
+def workspace_files(state):
+    # {relative path: source} for the code and the tests
+    files = {}
+    if wants_structured(state) and state.get("code_files"):
+        files.update({_safe_path(f["path"], "solution.py"): f["content"] for f in state["code_files"]})
+    else:
+        files["solution.py"] = extract_python(state["code"])
+    if wants_structured(state) and state.get("test_files"):
+        tests = {_safe_path(f["path"], "test_solution.py"): f["content"] for f in state["test_files"]}
+    else:
+        tests = {"test_solution.py": extract_python(state["tests"])}
+    tests = {(path if os.path.basename(path).startswith("test") else f"test_{os.path.basename(path)}"): source
+             for path, source in tests.items()}
+
+    # free text code has no file name, so also put it wherever the tests
+    # import it from (e.g. "from fibonacci import fib")
+    if "solution.py" in files and len(files) == 1:
+        for source in tests.values():
+            for match in IMPORTED_MODULE.finditer(source):
+                module = (match.group(1) or match.group(2)).split(".")[0]
+                if f"{module}.py" not in files and module != "pytest" and importlib.util.find_spec(module) is None:
+                    files[f"{module}.py"] = files["solution.py"]
+    files.update(tests)
+    return files
+
+
+def _parse_report(path):
+    try:
+        root = ET.parse(path).getroot()
+    except (OSError, ET.ParseError):
+        return None
+    suite = root if root.tag == "testsuite" else root.find("testsuite")
+    if suite is None:
+        return None
+    failures = []
+    for case in suite.iter("testcase"):
+        problem = case.find("failure")
+        if problem is None:
+            problem = case.find("error")
+        if problem is not None:
+            failures.append({
+                "test": f"{case.get('classname', '')}::{case.get('name', '')}".strip(":"),
+                "message": (problem.get("message") or problem.text or "")[:500]
+            })
+    tests = int(suite.get("tests", 0))
+    failed = int(suite.get("failures", 0))
+    errors = int(suite.get("errors", 0))
+    skipped = int(suite.get("skipped", 0))
+    return {
+        "tests": tests,
+        "passed": tests - failed - errors - skipped,
+        "failed": failed,
+        "errors": errors,
+        "skipped": skipped,
+        "failures": failures[:20]
+    }
+
+
+def run_tests(files):
+    # write the files to a temp dir and run pytest on them, returns a results dict
+    settings = get_sandbox_settings()
+    started = time.perf_counter()
+    with tempfile.TemporaryDirectory(prefix="codecraft-sandbox-") as workspace:
+        for path, source in files.items():
+            full = os.path.join(workspace, path)
+            os.makedirs(os.path.dirname(full), exist_ok=True)
+            with open(full, "w", encoding="utf-8") as f:
+                f.write(source)
+
+        report = os.path.join(workspace, ".report.xml")
+        command = [
+            sys.executable, "-I", "-c", LAUNCHER,
+            str(settings["cpu_seconds"]), str(settings["memory_mb"] * 1024 * 1024),
+            "-q", "-p", "no:cacheprovider", f"--junitxml={report}", workspace
+        ]
+        # only what python needs - no api keys or other secrets from our env
+        env = {"PATH": os.environ.get("PATH", ""), "PYTHONDONTWRITEBYTECODE": "1", "HOME": workspace}
+        if os.environ.get("SYSTEMROOT"):
+            env["SYSTEMROOT"] = os.environ["SYSTEMROOT"]  # windows python won't start without it
+        try:
+            process = subprocess.run(
+                command, cwd=workspace, env=env, capture_output=True, text=True,
+                timeout=settings["timeout"], stdin=subprocess.DEVNULL
+            )
+        except subprocess.TimeoutExpired:
+            return {"status": "timeout", "seconds": round(time.perf_counter() - started, 3),
+                    "output": f"Tests didn't finish within {settings['timeout']}s"}
+
+        results = _parse_report(report) or {}
+        output = (process.stdout + process.stderr)[-settings["output_chars"]:]
+        if process.returncode < 0:
+            output += f"\nKilled by signal {-process.returncode} (over the cpu or memory limit?)"
+
+    if not results:
+        status = "error"  # pytest didn't even get to run the tests (syntax error, limits hit...)
+    elif results["failed"] or results["errors"]:
+        status = "failed"
+    else:
+        status = "passed" if results["tests"] else "no_tests"
+    return {"status": status, **results, "exit_code": process.returncode,
+            "seconds": round(time.perf_counter() - started, 3), "output": output}
+
+
+def execute(state):
+    # run the state's tests on the worker pool and wait for them
+    return get_pool().submit(run_tests, workspace_files(state)).result()
+
+
+async def aexecute(state):
+    return await asyncio.get_running_loop().run_in_executor(get_pool(), run_tests, workspace_files(state))
+
+
+def render_test_results(results):
+    # short text version for the reviewer/coder prompts
+    if not results:
+        return ""
+    if results["status"] in ("timeout", "error"):
+        return f"Test run {results['status']} after {results['seconds']}s:\n{results.get('output', '')[-1500:]}"
+    lines = [f"{results['passed']} passed, {results['failed']} failed, {results['errors']} errors "
+             f"in {results['seconds']}s"]
+    lines += [f"- {f['test']}: {f['message']}" for f in results.get("failures", [])]
+    return "\n".join(lines)
@@ -0,0 +1,151 @@
+# structured outputs for each agent
+# instead of pasting every agent's whole markdown answer into the next prompt,
+# agents reply with json matching these schemas and the next agent only gets
+# the parts it needs (e.g. the coder sees components/interfaces, not the essay)
+import json
+import re
+from typing import List, Literal
+
+from pydantic import BaseModel, Field, ValidationError
+
+from config import get_structured_outputs
+
+
+class Component(BaseModel):
+    name: str
+    responsibility: str
+
+
+class Interface(BaseModel):
+    name: str
+    signature: str = Field(description="Python signature, e.g. def fib(n: int) -> int")
+    description: str = ""
+
+
+class ArchitectOutput(BaseModel):
+    summary: str = Field(description="Two or three sentences")
+    components: List[Component]
+    interfaces: List[Interface]
+
+
+class SourceFile(BaseModel):
+    path: str
+    content: str = Field(description="Complete file contents")
+
+
+class CoderOutput(BaseModel):
+    files: List[SourceFile]
+
+
+class TesterOutput(BaseModel):
+    files: List[SourceFile] = Field(description="pytest files")
+
+
+class ReviewIssue(BaseModel):
+    severity: Literal["critical", "major", "minor"]
+    location: str = Field(description="File and function the issue is in")
+    description: str
+
+
+class ReviewerOutput(BaseModel):
+    summary: str
+    issues: List[ReviewIssue]
+    changes_required: bool
+
+
+def wants_structured(state):
+    # per request setting, falls back to STRUCTURED_OUTPUTS
+    value = state.get("structured_outputs")
+    return get_structured_outputs() if value is None else value
+
+
+def _shape(node, defs):
+    # compact json "shape" of a schema node, e.g. {"name": "str", "tags": ["str"]}
+    if "$ref" in node:
+        return _shape(defs[node["$ref"].split("/")[-1]], defs)
+    if "enum" in node:
+        return "|".join(node["enum"])
+    kind = node.get("type")
+    if kind == "object":
+        return {name: _shape(prop, defs) for name, prop in node.get("properties", {}).items()}
+    if kind == "array":
+        return [_shape(node.get("items", {}), defs)]
+    return {"string": "str", "boolean": "bool", "integer": "int", "number": "float"}.get(kind, "any")
+
+
+def structured_instruction(schema):
+    # appended to the prompt so any model (not just ones with json mode) can do it
+    # a compact shape instead of the full json schema keeps the prompt small
+    full = schema.model_json_schema()
+    shape = _shape(full, full.get("$defs", {}))
+    return (
+        f"Reply with ONLY a JSON object (no markdown, no prose) for {schema.__name__}, "
+        f"shaped like:\n{json.dumps(shape)}"
+    )
+
+
+def parse_structured(text, schema):
+    # the schema instance, or None if the model didn't give us valid json
+    text = (text or "").strip()
+    fenced = re.search(r"```(?:json)?\s*(\{.*\})\s*```", text, re.DOTALL)
+    if fenced:
+        text = fenced.group(1)
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end <= start:
+        return None
+    try:
+        return schema.model_validate_json(text[start:end + 1])
+    except ValidationError:
+        return None
+
+
+# rendering - what goes into the plain text state fields and the api response
+
+def render_architecture(spec):
+    lines = [spec.summary, "", "Components:"]
+    lines += [f"- {c.name}: {c.responsibility}" for c in spec.components]
+    lines += ["", "Interfaces:"]
+    lines += [f"- {i.signature}" + (f"  # {i.description}" if i.description else "") for i in spec.interfaces]
+    return "\n".join(lines)
+
+
+def architecture_brief(state):
+    # just the components and interfaces - all the coder needs
+    spec = state.get("architecture_spec")
+    if not spec:
+        return state["architecture"]
+    spec = ArchitectOutput.model_validate(spec)
+    lines = ["Components:"]
+    lines += [f"- {c.name}: {c.responsibility}" for c in spec.components]
+    lines += ["", "Interfaces:"]
+    lines += [f"- {i.signature}" for i in spec.interfaces]
+    return "\n".join(lines)
+
+
+FILE_BLOCK = re.compile(r"# file: (\S+)\n```python\n(.*?)```", re.DOTALL)
+
+
+def render_files(files):
+    return "\n\n".join(f"# file: {f['path']}\n```python\n{f['content'].rstrip()}\n```" for f in files)
+
+
+def parse_rendered_files(text):
+    # back from render_files() output, e.g. after the coder's edits were applied
+    return [{"path": path, "content": content} for path, content in FILE_BLOCK.findall(text or "")]
+
+
+def render_review(spec):
+    lines = [spec.summary, ""]
+    lines += [f"- [{i.severity}] {i.location}: {i.description}" for i in spec.issues] or ["No issues found."]
+    # keeps the manager's structured decision strategy working off the text
+    lines += ["", f"CHANGES_REQUIRED: {'yes' if spec.changes_required else 'no'}"]
+    return "\n".join(lines)
+
+
+def review_brief(state):
+    # just the issues - what the coder needs to fix
+    spec = state.get("review_spec")
+    if not spec:
+        return state["review"]
+    spec = ReviewerOutput.model_validate(spec)
+    return "\n".join(f"- [{i.severity}] {i.location}: {i.description}" for i in spec.issues) or spec.summary
@@ -0,0 +1,336 @@
+# semantic cache for whole runs
+# the response cache in agents/cache.py only matches exact prompts, but lots of
+# tasks are paraphrases ("fibonacci function in python" / "write a python
+# fibonacci function"). here every approved run is stored under an embedding of
+# its task, and a new task close enough to an old one reuses its result, or at
+# least its architecture. vectors live in a numpy matrix saved to one .npz file
+import contextlib
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+import numpy as np
+
+try:
+    import fcntl  # unix only
+except ImportError:
+    fcntl = None
+
+from config import get_semantic_cache_settings
+from logs import get_logger
+
+log = get_logger(__name__)
+
+# words that say nothing about *what* to build. the language stays in
+STOPWORDS = {
+    "a", "an", "the", "and", "or", "of", "in", "for", "on", "with", "that", "this", "is", "it",
+    "be", "as", "by", "me", "my", "i", "you", "we", "please", "can", "could", "would", "should",
+    "code", "program", "function", "script", "simple", "small", "using", "use", "which", "will", "some",
+}
+
+# "write a parser" = "create a parser", but only as the opening verb. after
+# that they mean something ("read and write a csv file")
+OPENING_VERBS = {"write", "create", "make", "build", "implement", "generate", "develop", "give"}
+
+# words that give the task a direction: "binary to decimal" isn't "decimal to binary"
+DIRECTIONS = {"to", "into", "from", "than", "vs", "versus"}
+
+
+def _stem(word):
+    # crude, but enough to make "numbers"/"number" and "calculates"/"calculate" match
+    for suffix in ("ing", "ies", "es", "ed", "s"):
+        if len(word) > len(suffix) + 3 and word.endswith(suffix):
+            word = word[:-len(suffix)] + ("y" if suffix == "ies" else "")
+            break
+    return word[:-1] if len(word) > 4 and word.endswith("e") else word
+
+
+def task_terms(text):
+    # content words (stemmed) and direction words, in order
+    words = [word for word in re.findall(r"[a-z0-9]+", (text or "").lower()) if word not in STOPWORDS]
+    if words and words[0] in OPENING_VERBS:
+        words = words[1:]
+    # "(a function) to sort a list" - a leading "to" has no direction
+    while words and words[0] in DIRECTIONS:
+        words = words[1:]
+    return [word if word in DIRECTIONS else _stem(word) for word in words]
+
+
+def _directions(terms):
+    # (before, direction, after) for every direction word
+    return [(terms[i - 1] if i else "", term, terms[i + 1] if i + 1 < len(terms) else "")
+            for i, term in enumerate(terms) if term in DIRECTIONS]
+
+
+def compare_tasks(a, b):
+    # the embedding alone can't be trusted with word order, so check the terms:
+    # "same" = same words, same directions (word order otherwise doesn't matter,
+    # "python fibonacci" = "fibonacci in python"), "reversed" = same words going
+    # the other way, "different" = anything else
+    terms_a, terms_b = task_terms(a), task_terms(b)
+    if sorted(terms_a) != sorted(terms_b):
+        return "different"
+    return "same" if _directions(terms_a) == _directions(terms_b) else "reversed"
+
+
+class HashingEmbedder:
+    # words, character trigrams and word pairs, hashed into a fixed size vector.
+    # no model download, and good enough for "same task, different wording".
+    # the word pairs keep some of the order ("binary to" vs "decimal to")
+    name = "hashing-v2"
+
+    def __init__(self, dim=512):
+        self.dim = dim
+
+    def _add(self, vector, feature, weight):
+        digest = hashlib.blake2b(feature.encode(), digest_size=8).digest()
+        index = int.from_bytes(digest[:4], "little") % self.dim
+        sign = 1.0 if digest[4] & 1 else -1.0
+        vector[index] += sign * weight
+
+    def embed(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        terms = task_terms(text)
+        for first, second in zip(terms, terms[1:]):
+            self._add(vector, f"b:{first} {second}", 0.5)
+        for word in terms:
+            if word in DIRECTIONS:
+                continue
+            self._add(vector, f"w:{word}", 1.0)
+            padded = f"#{word}#"
+            for i in range(len(padded) - 2):
+                self._add(vector, f"c:{padded[i:i + 3]}", 0.25)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+class SentenceTransformerEmbedder:
+    # a real local embedding model, if sentence-transformers is installed
+
+    def __init__(self, model_name):
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name)
+        self.name = f"st:{model_name}"
+        self.dim = self.model.get_sentence_embedding_dimension()
+
+    def embed(self, text):
+        return self.model.encode(text, normalize_embeddings=True).astype(np.float32)
+
+
+def build_embedder(model_name=None):
+    if model_name:
+        try:
+            return SentenceTransformerEmbedder(model_name)
+        except Exception as e:
+            log.warning("couldn't load the embedding model, using hashed embeddings",
+                        extra={"model": model_name, "error": repr(e)})
+    return HashingEmbedder()
+
+
+@contextlib.contextmanager
+def _file_lock(path):
+    # one process at a time reads-merges-writes the index (just the in-process lock on windows)
+    if fcntl is None:
+        yield
+        return
+    with open(f"{path}.lock", "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def settings_fingerprint(settings):
+    # runs are only reused for requests with the same settings (models, topology, ...)
+    return hashlib.sha256(json.dumps(settings, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+class SemanticCache:
+
+    def __init__(self, embedder, path="", max_entries=2000, save_interval=30.0):
+        self.embedder = embedder
+        self.path = path
+        self.max_entries = max_entries
+        self.save_interval = save_interval
+        self._lock = threading.Lock()
+        self._vectors = np.zeros((0, embedder.dim), dtype=np.float32)
+        self._entries = []
+        self._dirty = False
+        self._saved_at = time.monotonic()
+        self.hits = {"result": 0, "architecture": 0}
+        self.misses = 0
+        if path:
+            self._load()
+
+    def _read(self):
+        # (vectors, entries) from the index file, None if there's nothing usable
+        if not os.path.exists(self.path):
+            return None
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                meta = json.loads(str(data["meta"]))
+                vectors = data["vectors"]
+        except (OSError, ValueError, KeyError) as e:
+            log.warning("couldn't read the index", extra={"path": self.path, "error": repr(e)})
+            return None
+        if meta.get("embedder") != self.embedder.name or vectors.shape[1:] != (self.embedder.dim,):
+            return None  # built with another embedding, the vectors don't compare
+        return vectors.astype(np.float32), meta["entries"]
+
+    def _load(self):
+        saved = self._read()
+        if saved is not None:
+            self._vectors, self._entries = saved
+
+    def _merge(self, saved):
+        # fold in what other workers saved since we loaded. the same task with the
+        # same settings is kept once, the newest version, then the oldest go past max_entries
+        if saved is None:
+            return
+        merged = {}
+        for vectors, entries in (saved, (self._vectors, self._entries)):
+            for vector, entry in zip(vectors, entries):
+                key = (entry["task"], entry["fingerprint"])
+                if key not in merged or entry["created_at"] >= merged[key][1]["created_at"]:
+                    merged[key] = (vector, entry)
+        kept = sorted(merged.values(), key=lambda item: item[1]["created_at"])[-self.max_entries:]
+        self._vectors = np.array([vector for vector, _ in kept], dtype=np.float32).reshape(-1, self.embedder.dim)
+        self._entries = [entry for _, entry in kept]
+
+    def save(self):
+        # every worker has its own copy of the index but they share the file,
+        # so merge with it instead of overwriting the others' entries.
+        # blocking (file io, np.savez), call it from a thread in async code
+        if not self.path or not self._dirty:
+            return
+        with _file_lock(self.path):
+            saved = self._read()
+            with self._lock:
+                self._merge(saved)
+                vectors = self._vectors.copy()
+                meta = json.dumps({"embedder": self.embedder.name, "entries": self._entries})
+                self._dirty = False
+                self._saved_at = time.monotonic()
+            tmp = f"{self.path}.{os.getpid()}.tmp.npz"
+            np.savez(tmp, vectors=vectors, meta=np.array(meta))
+            os.replace(tmp, self.path)
+
+    def search(self, task, fingerprint):
+        # (best matching entry, similarity) among entries with the same settings
+        query = self.embedder.embed(task)
+        with self._lock:
+            if not self._entries:
+                return None, 0.0
+            similarities = self._vectors @ query
+            same_settings = np.array([entry["fingerprint"] == fingerprint for entry in self._entries])
+            similarities = np.where(same_settings, similarities, -1.0)
+            best = int(np.argmax(similarities))
+            if not same_settings[best]:
+                return None, 0.0
+            return self._entries[best], min(float(similarities[best]), 1.0)
+
+    def add(self, task, fingerprint, result):
+        vector = self.embedder.embed(task)
+        entry = {"task": task, "fingerprint": fingerprint, "result": result, "created_at": time.time()}
+        with self._lock:
+            # a near-identical task with the same settings gets replaced, not duplicated
+            similarities = self._vectors @ vector
+            duplicates = [index for index in np.flatnonzero(similarities >= 0.99)
+                          if self._entries[index]["fingerprint"] == fingerprint]
+            if duplicates:
+                self._vectors[duplicates[0]] = vector
+                self._entries[duplicates[0]] = entry
+                self._dirty = True
+            else:
+                self._append(vector, entry)
+            due = time.monotonic() - self._saved_at > self.save_interval
+        if due:
+            self.save()
+
+    def _append(self, vector, entry):
+        self._vectors = np.vstack([self._vectors, vector[None, :]])
+        self._entries.append(entry)
+        if len(self._entries) > self.max_entries:
+            # oldest out first
+            drop = len(self._entries) - self.max_entries
+            self._vectors = self._vectors[drop:]
+            self._entries = self._entries[drop:]
+        self._dirty = True
+
+    def clear(self):
+        with self._lock:
+            self._vectors = np.zeros((0, self.embedder.dim), dtype=np.float32)
+            self._entries = []
+            self._dirty = True
+
+    def stats(self):
+        return {
+            "enabled": True,
+            "entries": len(self._entries),
+            "embedder": self.embedder.name,
+            "hits": dict(self.hits),
+            "misses": self.misses
+        }
+
+
+_semantic_cache = None
+_semantic_cache_lock = threading.Lock()
+
+
+def get_semantic_cache():
+    # None when SEMANTIC_CACHE_ENABLED is off
+    global _semantic_cache
+    settings = get_semantic_cache_settings()
+    if not settings["enabled"]:
+        return None
+    with _semantic_cache_lock:
+        if _semantic_cache is None:
+            _semantic_cache = SemanticCache(
+                build_embedder(settings["model"]), settings["path"],
+                settings["max_entries"], settings["save_interval"]
+            )
+        return _semantic_cache
+
+
+def set_semantic_cache(cache):
+    # swap it out, e.g. an in-memory one for benchmarks
+    global _semantic_cache
+    _semantic_cache = cache
+
+
+def semantic_cache_stats():
+    cache = get_semantic_cache()
+    return cache.stats() if cache is not None else {"enabled": False}
+
+
+def lookup(task, fingerprint):
+    # ("result" | "architecture", entry, similarity), or None on a miss
+    cache = get_semantic_cache()
+    if cache is None:
+        return None
+    settings = get_semantic_cache_settings()
+    entry, similarity = cache.search(task, fingerprint)
+    if entry is None or similarity < settings["architecture_threshold"]:
+        cache.misses += 1
+        return None
+    match = compare_tasks(task, entry["task"])
+    if match == "reversed":
+        # the opposite task, even its architecture would be wrong
+        cache.misses += 1
+        return None
+    # only the same terms get the result as is, a close but different task its architecture
+    kind = "result" if similarity >= settings["result_threshold"] and match == "same" else "architecture"
+    cache.hits[kind] += 1
+    return kind, entry, similarity
+
+
+def remember(task, fingerprint, result):
+    # store an approved run's api response. can write the index file, so async
+    # code calls it through asyncio.to_thread
+    cache = get_semantic_cache()
+    if cache is not None:
+        cache.add(task, fingerprint, result)
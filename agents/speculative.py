@@ -0,0 +1,182 @@
+# best-of-N coding
+# every rewrite used to cost a whole serial round: one coder attempt, then
+# tester, reviewer and manager. with more than one candidate the coder writes
+# several versions at once (other temperatures/models), each one is tested and
+# reviewed at the same time, and only the best goes on to the manager
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from config import get_speculative_settings
+from agents.llm import model_chain
+from agents.coder import coder_agent, coder_agent_async
+from agents.tester import tester_agent, tester_agent_async
+from agents.executor import executor_agent, executor_agent_async
+from agents.reviewer import (
+    reviewer_agent, reviewer_agent_async,
+    code_reviewer_agent, code_reviewer_agent_async
+)
+from agents.decision import local_decision
+from orchestration.limits import has_converged
+from metrics import record_candidate_win
+from logs import get_logger, log_context
+
+log = get_logger(__name__)
+
+# what the winning candidate hands on to the manager
+CANDIDATE_KEYS = (
+    "code", "code_files", "previous_code", "changed_functions", "iteration",
+    "tests", "test_files", "test_results", "review", "review_spec"
+)
+
+
+def candidate_count(state):
+    # per request setting, falls back to SPECULATIVE_CANDIDATES
+    return max(state.get("candidates") or get_speculative_settings()["candidates"], 1)
+
+
+def wants_candidates(state):
+    return candidate_count(state) > 1
+
+
+def candidate_overrides(state):
+    # llm overrides for each candidate. the first one is the coder as configured
+    # (so it can still come from the response cache), the rest vary temperature/model
+    settings = get_speculative_settings()
+    overrides = state.get("llm_overrides") or {}
+    variants = []
+    for i in range(candidate_count(state)):
+        coder = dict(overrides.get("coder") or {})
+        if i:
+            coder["temperature"] = settings["temperatures"][(i - 1) % len(settings["temperatures"])]
+            if settings["models"]:
+                coder["model"] = settings["models"][(i - 1) % len(settings["models"])]
+        variants.append({**overrides, "coder": coder})
+    return variants
+
+
+def _apply(candidate, update):
+    # fold an agent's update into the candidate, returns the tokens it spent
+    update = dict(update or {})
+    spent = update.pop("tokens_used", 0)
+    update.pop("timings", None)
+    candidate.update(update)
+    return spent
+
+
+def _run_stages(state, overrides):
+    # coder -> tester -> executor -> reviewer for one candidate
+    candidate = {**state, "llm_overrides": overrides}
+    spent = _apply(candidate, coder_agent(candidate))
+    if has_converged(candidate):
+        return candidate, spent  # same code the manager just sent back
+    review = code_reviewer_agent if state.get("topology") == "parallel" else reviewer_agent
+    for agent in (tester_agent, executor_agent, review):
+        spent += _apply(candidate, agent(candidate))
+    return candidate, spent
+
+
+async def _arun_stages(state, overrides):
+    candidate = {**state, "llm_overrides": overrides}
+    spent = _apply(candidate, await coder_agent_async(candidate))
+    if has_converged(candidate):
+        return candidate, spent
+
+    async def test():
+        tokens = _apply(candidate, await tester_agent_async(candidate))
+        return tokens + _apply(candidate, await executor_agent_async(candidate))
+
+    if state.get("topology") == "parallel":
+        # same as the parallel graph: code-only review while the tests are written and run
+        async def review():
+            return _apply(candidate, await code_reviewer_agent_async(candidate))
+        spent += sum(await asyncio.gather(test(), review()))
+    else:
+        spent += await test()
+        spent += _apply(candidate, await reviewer_agent_async(candidate))
+    return candidate, spent
+
+
+def _run_candidate(state, overrides, index):
+    # the candidate's log records say which one they're from
+    with log_context(candidate=index):
+        return _run_stages(state, overrides)
+
+
+async def _arun_candidate(state, overrides, index):
+    with log_context(candidate=index):
+        return await _arun_stages(state, overrides)
+
+
+def score(candidate):
+    # higher is better: share of tests passing first, then the review's verdict
+    results = candidate.get("test_results")
+    if results is None:
+        tests = 0.5  # tests weren't run
+    elif results.get("tests"):
+        tests = results["passed"] / results["tests"]
+    else:
+        tests = 0.0  # error, timeout or no tests collected
+    verdict = local_decision(candidate.get("review"), "auto")
+    review = 0.5 if verdict is None else (1.0 if verdict[0] == "approve" else 0.0)
+    return round(tests, 4), review
+
+
+def _report(index, overrides, outcome):
+    options = model_chain("coder", overrides)[0]
+    entry = {"candidate": index, "model": options["model"], "temperature": options["temperature"]}
+    if isinstance(outcome, BaseException):
+        return {**entry, "error": str(outcome)}
+    candidate, _ = outcome
+    if has_converged(candidate):
+        return {**entry, "converged": True}
+    results = candidate.get("test_results") or {}
+    return {**entry, "test_status": results.get("status"), "score": list(score(candidate))}
+
+
+def _pick(state, variants, outcomes):
+    # the state update for the winning candidate
+    failed = [o for o in outcomes if isinstance(o, BaseException)]
+    if len(failed) == len(outcomes):
+        raise failed[0]
+
+    finished = [(i, o[0]) for i, o in enumerate(outcomes) if not isinstance(o, BaseException)]
+    # unchanged code only wins if every candidate came back unchanged (the run converged)
+    pool = [(i, c) for i, c in finished if not has_converged(c)] or finished[:1]
+    winner, candidate = max(pool, key=lambda item: (score(item[1]), -item[0]))
+    record_candidate_win(winner)
+
+    report = [_report(i, variants[i], outcome) for i, outcome in enumerate(outcomes)]
+    report[winner]["winner"] = True
+    log.info("picked a candidate", extra={"winner": winner, "candidates": len(outcomes)})
+    return {
+        **{key: candidate.get(key) for key in CANDIDATE_KEYS},
+        "candidate_scores": report,
+        # every candidate's tokens were spent, not just the winner's
+        "tokens_used": sum(o[1] for o in outcomes if not isinstance(o, BaseException))
+    }
+
+
+def candidates_agent(state):
+    log.info("writing candidates", extra={"candidates": candidate_count(state)})
+    variants = candidate_overrides(state)
+    with ThreadPoolExecutor(max_workers=len(variants), thread_name_prefix="candidate") as pool:
+        # copy the context so each thread's llm calls land in this node's timings and logs
+        futures = [pool.submit(contextvars.copy_context().run, _run_candidate, state, overrides, i)
+                   for i, overrides in enumerate(variants)]
+        outcomes = []
+        for future in futures:
+            try:
+                outcomes.append(future.result())
+            except Exception as e:
+                outcomes.append(e)
+    return _pick(state, variants, outcomes)
+
+
+async def candidates_agent_async(state):
+    log.info("writing candidates", extra={"candidates": candidate_count(state)})
+    variants = candidate_overrides(state)
+    outcomes = await asyncio.gather(
+        *(_arun_candidate(state, overrides, i) for i, overrides in enumerate(variants)), return_exceptions=True
+    )
+    return _pick(state, variants, list(outcomes))
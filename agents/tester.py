@@ -1,32 +1,97 @@
-from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage
-from config import get_openrouter_api_key, get_openrouter_model
-
-def get_llm():
-    return ChatOpenAI(
-        model=get_openrouter_model(),
-        temperature=0,
-        api_key=get_openrouter_api_key(),
-        base_url="https://openrouter.ai/api/v1",
-        default_headers={
-            "HTTP-Referer": "https://github.com/your-repo",
-            "X-Title": "Codecraft AI"
-        }
-    )
+from agents.llm import call_llm, acall_llm, response_tokens
+from agents.edits import merge_tests
+from agents.prompt_budget import compact_code
+from agents.schemas import (
+    TesterOutput, parse_structured, render_files, structured_instruction, wants_structured
+)
+from logs import body, get_logger
 
-def tester_agent(state):
-    print("\n[TESTER] AGENT STARTED")
+log = get_logger(__name__)
+
+def _with_format(state, prompt):
+    if wants_structured(state):
+        prompt += "\n" + structured_instruction(TesterOutput)
+    return [HumanMessage(content=prompt)]
 
-    llm = get_llm()
+def _tester_messages(state):
     # create test cases for the generated code
-    response = llm.invoke([
-        HumanMessage(content=f"""Write pytest test cases for the following code:
+    return _with_format(state, f"""Write pytest test cases for the following code:
+
+{compact_code(state['code'])}
+""")
 
-{state['code']}
+def _tester_update_messages(state):
+    # only the functions the coder just changed need new tests
+    return _with_format(state, f"""Write pytest test cases for the following code.
+Only test these functions, the rest already have tests: {', '.join(state['changed_functions'])}
+
+{compact_code(state['code'])}
 """)
-    ])
 
-    tests = response.content
-    print("GENERATED TESTS:\n", tests)
+def _only_changed(state):
+    return state.get("changed_functions") is not None and bool(state.get("tests"))
+
+def _parse_tests(state, response):
+    # (tests text, test files or None)
+    spec = parse_structured(response.content, TesterOutput) if wants_structured(state) else None
+    if not spec:
+        return response.content, None
+    files = [f.model_dump() for f in spec.files]
+    return render_files(files), files
+
+def _tester_result(state, response, extra_tokens=0):
+    tests, files = _parse_tests(state, response)
+    log.info("tests written", extra={"output": body(tests)})
+
+    return {"tests": tests, "test_files": files, "tokens_used": response_tokens(response) + extra_tokens}
+
+def _merged_result(state, response):
+    # fold the new tests into the existing ones, None if that didn't work
+    new_tests, _ = _parse_tests(state, response)
+    merged = merge_tests(state["tests"], new_tests, state["changed_functions"])
+    if merged is None:
+        return None
+    files = None
+    if state.get("test_files"):
+        # everything ends up in one file once merged
+        files = [{"path": state["test_files"][0]["path"], "content": merged}]
+    tests = render_files(files) if files else merged
+    log.info("tests written", extra={"output": body(tests)})
+    return {"tests": tests, "test_files": files, "tokens_used": response_tokens(response)}
+
+def _unchanged_tests(state):
+    log.info("no functions changed, keeping the tests")
+    return {"tests": state["tests"], "tokens_used": 0}
+
+def tester_agent(state):
+    log.info("tester started")
+
+    spent = 0
+    if _only_changed(state):
+        if not state["changed_functions"]:
+            return _unchanged_tests(state)
+        response = call_llm("tester", _tester_update_messages(state), state.get("llm_overrides"))
+        merged = _merged_result(state, response)
+        if merged is not None:
+            return merged
+        spent = response_tokens(response)  # couldn't merge, write them all again
+
+    response = call_llm("tester", _tester_messages(state), state.get("llm_overrides"))
+    return _tester_result(state, response, extra_tokens=spent)
+
+async def tester_agent_async(state):
+    log.info("tester started")
+
+    spent = 0
+    if _only_changed(state):
+        if not state["changed_functions"]:
+            return _unchanged_tests(state)
+        response = await acall_llm("tester", _tester_update_messages(state), state.get("llm_overrides"))
+        merged = _merged_result(state, response)
+        if merged is not None:
+            return merged
+        spent = response_tokens(response)
 
-    return {"tests": tests}
+    response = await acall_llm("tester", _tester_messages(state), state.get("llm_overrides"))
+    return _tester_result(state, response, extra_tokens=spent)
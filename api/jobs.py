@@ -0,0 +1,213 @@
+# background jobs for long generations
+# a job is queued right away and a small pool of workers runs it through the
+# agent graph, so the http request doesn't have to stay open for minutes
+import asyncio
+import time
+import uuid
+from collections import OrderedDict, deque
+
+from logs import get_logger
+
+log = get_logger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, tenant, inputs, topology, config=None):
+        self.id = uuid.uuid4().hex
+        self.tenant = tenant
+        self.inputs = inputs
+        self.topology = topology
+        self.config = config
+        self.status = QUEUED
+        self.stage = None
+        self.state = dict(inputs)  # partial AgentState, filled in as agents finish
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.task = None  # asyncio task while running
+
+    @property
+    def run_id(self):
+        # checkpoint thread id of the job's graph run
+        return ((self.config or {}).get("configurable") or {}).get("thread_id")
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "run_id": self.run_id,
+            "tenant": self.tenant,
+            "status": self.status,
+            "stage": self.stage,
+            "state": self.state,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at
+        }
+
+
+class JobManager:
+    # jobs are queued per tenant and workers take them round-robin across
+    # tenants, so one tenant submitting a lot can't starve everyone else
+
+    def __init__(self, get_graph, workers=8, max_queued=1000, result_ttl=3600, format_error=None):
+        self.get_graph = get_graph  # topology name -> compiled graph
+        self.workers = workers
+        self.max_queued = max_queued
+        self.result_ttl = result_ttl
+        self.format_error = format_error or (lambda e, run_id=None: {"message": str(e), "run_id": run_id})
+        self._jobs = {}
+        self._queues = OrderedDict()  # tenant -> deque of waiting jobs
+        self._queued_count = 0
+        self._ready = None
+        self._worker_tasks = []
+        self._draining = False
+
+    def _ensure_started(self):
+        # workers need a running event loop, so start them on first use
+        if self._worker_tasks:
+            return
+        self._ready = asyncio.Condition()
+        self._worker_tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def submit(self, inputs, tenant="default", topology="sequential", config=None):
+        self._ensure_started()
+        self._evict_expired()
+        if self._draining:
+            raise QueueFullError("Server is shutting down, not taking new jobs")
+        if self._queued_count >= self.max_queued:
+            raise QueueFullError(f"Job queue is full ({self.max_queued} jobs waiting)")
+
+        job = Job(tenant, inputs, topology, config)
+        self._jobs[job.id] = job
+        async with self._ready:
+            self._queues.setdefault(tenant, deque()).append(job)
+            self._queued_count += 1
+            self._ready.notify()
+        return job
+
+    def get(self, job_id):
+        self._evict_expired()
+        return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is None or job.status in FINISHED:
+            return job
+        if job.status == QUEUED:
+            queue = self._queues.get(job.tenant)
+            if queue is not None and job in queue:
+                queue.remove(job)
+                self._queued_count -= 1
+                if not queue:
+                    del self._queues[job.tenant]
+            self._finish(job, CANCELLED)
+        elif job.task is not None:
+            job.task.cancel()  # _run marks it cancelled
+        return job
+
+    async def drain(self, timeout=None):
+        # graceful shutdown: take no new jobs, give queued and running ones up
+        # to `timeout` seconds to finish, then cancel the rest (their runs stay
+        # checkpointed, so they can be resumed)
+        self._draining = True
+        pending = [job for job in self._jobs.values() if job.status not in FINISHED]
+        if pending:
+            log.info("waiting for jobs to finish", extra={"jobs": len(pending)})
+            deadline = time.monotonic() + timeout if timeout else None
+            while any(job.status not in FINISHED for job in pending):
+                if deadline is not None and time.monotonic() > deadline:
+                    break
+                await asyncio.sleep(0.1)
+        for job in pending:
+            self.cancel(job.id)
+        tasks = [job.task for job in pending if job.task is not None] + self._worker_tasks
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._worker_tasks = []
+
+    def stats(self):
+        running = sum(1 for job in self._jobs.values() if job.status == RUNNING)
+        return {
+            "workers": self.workers,
+            "queued": self._queued_count,
+            "running": running,
+            "stored": len(self._jobs)
+        }
+
+    async def _next_job(self):
+        async with self._ready:
+            while not self._queues:
+                await self._ready.wait()
+            # round-robin: take from the first tenant, then move it to the back
+            tenant, queue = next(iter(self._queues.items()))
+            job = queue.popleft()
+            self._queued_count -= 1
+            if queue:
+                self._queues.move_to_end(tenant)
+            else:
+                del self._queues[tenant]
+            return job
+
+    async def _worker(self):
+        while True:
+            job = await self._next_job()
+            task = job.task = asyncio.create_task(self._run(job))
+            try:
+                # shield so cancelling the job doesn't kill the worker
+                await asyncio.shield(task)
+            except asyncio.CancelledError:
+                if not task.cancelled():
+                    raise  # the worker itself is being shut down
+
+    async def _run(self, job):
+        if job.status == CANCELLED:
+            return  # cancelled between leaving the queue and starting
+        job.status = RUNNING
+        job.started_at = time.time()
+        try:
+            graph = self.get_graph(job.topology)
+            # "updates" tells us which agent just ran, "values" is the full state after it
+            async for mode, chunk in graph.astream(
+                job.inputs, config=job.config, stream_mode=["updates", "values"]
+            ):
+                if mode == "updates":
+                    job.stage = next(iter(chunk), job.stage)
+                else:
+                    job.state = dict(chunk)
+            if graph.checkpointer and job.run_id:
+                await graph.checkpointer.adelete_thread(job.run_id)  # only failed runs are kept for resuming
+            self._finish(job, SUCCEEDED)
+        except asyncio.CancelledError:
+            self._finish(job, CANCELLED)
+            raise
+        except Exception as e:
+            job.error = self.format_error(e, job.run_id)
+            log.error("job failed", extra={"job_id": job.id, "run_id": job.run_id, "error": repr(e)})
+            self._finish(job, FAILED)
+
+    def _finish(self, job, status):
+        job.status = status
+        job.finished_at = time.time()
+        job.task = None
+
+    def _evict_expired(self):
+        # finished jobs are kept for result_ttl seconds, then dropped
+        cutoff = time.time() - self.result_ttl
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.status in FINISHED and job.finished_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
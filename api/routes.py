@@ -1,30 +1,320 @@
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
-from orchestration.graph import app as agent_app
+from fastapi import APIRouter, HTTPException, Header
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from typing import Dict, List, Literal, Optional
+# not orchestration.graph - that one loads langgraph and all the agents, see pipeline.py
+from orchestration.pipeline import afinish_run, ensure_ready, get_app, run_config, run_id_of, saved_run
+from orchestration.limits import initial_limits, stop_reason
+from agents.ratelimit import RateLimitWaitTooLong, admission_wait
+from agents.resilience import CircuitOpenError, is_retryable, retry_after
+from api.jobs import JobManager, QueueFullError, SUCCEEDED
+from config import get_max_concurrent_generations, get_job_settings, get_rate_limit_settings, get_rewrite_mode
+import asyncio
 import json
+import math
+
+from logs import body, get_logger
+
+log = get_logger(__name__)
 
 # API routes
 router = APIRouter(prefix="/api/v1", tags=["code-generation"])
 
-class TaskRequest(BaseModel):
+class AgentLLMSettings(BaseModel):
+    # per-request model settings for one agent, anything left out comes from config
+    model: Optional[str] = None
+    temperature: Optional[float] = Field(None, ge=0, le=2)
+    max_tokens: Optional[int] = Field(None, ge=1)
+    # seconds before giving up on a model and moving to the next fallback
+    timeout: Optional[float] = Field(None, gt=0)
+    fallbacks: Optional[List[str]] = None
+
+AgentName = Literal["architect", "coder", "tester", "reviewer", "manager"]
+
+class RunSettings(BaseModel):
+    # settings shared by single and batch requests
+    # "parallel" runs the tester and a code-only review at the same time
+    topology: Literal["sequential", "parallel"] = "sequential"
+    # limits for the rewrite loop, defaults come from config
+    max_iterations: Optional[int] = Field(None, ge=1)
+    max_seconds: Optional[float] = Field(None, gt=0)
+    max_tokens: Optional[int] = Field(None, ge=1)
+    # "incremental" sends the review back to the coder and applies its edits
+    rewrite_mode: Optional[Literal["incremental", "full"]] = None
+    # agents reply with json and pass on only what the next one needs, see config
+    structured_outputs: Optional[bool] = None
+    # how the manager decides - "llm", "structured", "keywords" or "auto", see config
+    decision_strategy: Optional[Literal["llm", "structured", "keywords", "auto"]] = None
+    # run the generated tests with pytest and show the reviewer the results, see config
+    execute_tests: Optional[bool] = None
+    # write this many code candidates per round and keep the best one, see config
+    candidates: Optional[int] = Field(None, ge=1, le=8)
+    # reuse the result (or architecture) of a very similar earlier task, see config
+    semantic_cache: bool = True
+    # e.g. {"manager": {"model": "openai/gpt-4o-mini", "max_tokens": 5}}
+    agents: Optional[Dict[AgentName, AgentLLMSettings]] = None
+
+class TaskRequest(RunSettings):
     task: str
     
     class Config:
         json_schema_extra = {
             "example": {
-                "task": "Create a Python function to calculate fibonacci numbers"
+                "task": "Create a Python function to calculate fibonacci numbers",
+                "topology": "sequential"
             }
         }
 
+class StageTiming(BaseModel):
+    stage: str
+    iteration: int
+    seconds: float
+    # time to first token of the node's first llm call
+    ttft: Optional[float] = None
+    llm_calls: int = 0
+    prompt_tokens: int = 0
+    # counted by us before sending, per call and in total
+    estimated_prompt_tokens: int = 0
+    call_prompt_tokens: List[int] = []
+    completion_tokens: int = 0
+    # estimated USD
+    cost: float = 0.0
+
 class TaskResponse(BaseModel):
+    # checkpoint thread id, POST /runs/{run_id}/resume picks a failed run back up
+    run_id: Optional[str] = None
     architecture: str
     code: str
     tests: str
     review: str
     final_decision: str
+    # "llm", "structured" or "keywords" - what made the final decision
+    decision_source: Optional[str] = None
+    iterations: int = 0
+    tokens_used: int = 0
+    # approved, converged, max_iterations, time_budget or token_budget
+    stop_reason: str = "approved"
+    # per node breakdown, in the order they ran
+    timings: List[StageTiming] = []
+    # structured versions of the fields above, when structured outputs are on
+    architecture_spec: Optional[dict] = None
+    code_files: Optional[List[dict]] = None
+    test_files: Optional[List[dict]] = None
+    review_spec: Optional[dict] = None
+    # pytest results from the last iteration (status, passed, failed, failures, ...)
+    test_results: Optional[dict] = None
+    # set when a similar earlier task was reused - kind ("result" or
+    # "architecture"), similarity and the earlier task
+    semantic_match: Optional[dict] = None
+    # best-of-N runs: how each candidate of the last round scored, and which won
+    candidate_scores: Optional[List[dict]] = None
+    # when a budget stopped the run: the iteration whose code/tests/review this is
+    # (the best one so far, not necessarily the last)
+    best_iteration: Optional[int] = None
+
+def task_response(result, run_id=None):
+    # final graph state -> api response
+    return TaskResponse(
+        run_id=run_id,
+        architecture=result.get("architecture", ""),
+        code=result.get("code", ""),
+        tests=result.get("tests", ""),
+        review=result.get("review", ""),
+        final_decision=result.get("decision", ""),
+        decision_source=result.get("decision_source"),
+        iterations=result.get("iteration", 0),
+        tokens_used=result.get("tokens_used", 0),
+        stop_reason=stop_reason(result),
+        timings=result.get("timings", []),
+        architecture_spec=result.get("architecture_spec"),
+        code_files=result.get("code_files"),
+        test_files=result.get("test_files"),
+        review_spec=result.get("review_spec"),
+        test_results=result.get("test_results"),
+        candidate_scores=result.get("candidate_scores"),
+        best_iteration=result.get("best_iteration")
+    )
+
+def initial_state(request, task=None, architecture=None, architecture_spec=None):
+    # what the graph starts with for a request
+    state = {
+        "task": task or request.task,
+        "topology": request.topology,
+        "rewrite_mode": request.rewrite_mode or get_rewrite_mode(),
+        "decision_strategy": request.decision_strategy,
+        "structured_outputs": request.structured_outputs,
+        "execute_tests": request.execute_tests,
+        "candidates": request.candidates,
+        "llm_overrides": {
+            agent: settings.model_dump(exclude_none=True)
+            for agent, settings in (request.agents or {}).items()
+        },
+        **initial_limits(request.max_iterations, request.max_seconds, request.max_tokens)
+    }
+    if architecture:
+        # the graph skips the architect when it already has one
+        state["architecture"] = architecture
+        state["architecture_spec"] = architecture_spec
+    return state
+
+def semantic_fingerprint(request):
+    # everything but the task has to match for a run to be reused
+    from agents.semantic_cache import settings_fingerprint  # numpy, only loaded when used
+    return settings_fingerprint(request.model_dump(exclude={"task", "semantic_cache"}))
+
+def semantic_lookup(request):
+    # (kind, entry, match info) for a similar earlier task, or None. embeds the task
+    # (and builds the index on first use), so call it with asyncio.to_thread
+    if not request.semantic_cache:
+        return None
+    from agents.semantic_cache import lookup
+    hit = lookup(request.task, semantic_fingerprint(request))
+    if hit is None:
+        return None
+    kind, entry, similarity = hit
+    log.info("semantic cache hit",
+             extra={"kind": kind, "similarity": round(similarity, 4), "task": body(request.task)})
+    return kind, entry, {"kind": kind, "similarity": round(similarity, 4), "task": entry["task"]}
+
+# caps in-flight agent runs per process, instead of the threadpool size
+_generation_slots = asyncio.Semaphore(get_max_concurrent_generations())
+
+def check_admission(state):
+    # admission control: don't start a run whose first llm call would queue for
+    # the rate limiter longer than RATE_LIMIT_MAX_WAIT (on every fallback model)
+    from agents.llm import model_chain  # loaded with the pipeline
+    agent = "coder" if state.get("architecture") else "architect"
+    chain = model_chain(agent, state.get("llm_overrides"))
+    waits = [
+        (admission_wait(options["model"]), get_rate_limit_settings(options["model"])["max_wait"])
+        for options in chain
+    ]
+    if all(max_wait and wait > max_wait for wait, max_wait in waits):
+        raise_api_error(RateLimitWaitTooLong(chain[0]["model"], min(wait for wait, _ in waits)))
+
+def raise_run_error(e, run_id):
+    # raise_api_error, with the run id so the client can resume the run
+    log.error("run failed", extra={"run_id": run_id, "error": repr(e)})
+    try:
+        raise_api_error(e)
+    except HTTPException as http_exc:
+        if run_id and isinstance(http_exc.detail, dict):
+            http_exc.detail["run_id"] = run_id
+            http_exc.detail["resume_url"] = f"{router.prefix}/runs/{run_id}/resume"
+        raise
+
+def raise_api_error(e):
+    # turn an exception from the agent workflow into a helpful HTTPException
+    # Check for OpenAI/OpenRouter authentication errors and map them to 401
+    try:
+        import openai
+        # Support both openai.AuthenticationError and openai.error.AuthenticationError
+        auth_exc = getattr(openai, 'AuthenticationError', None)
+        if auth_exc is None and hasattr(openai, 'error'):
+            auth_exc = getattr(openai.error, 'AuthenticationError', None)
+    except Exception:
+        auth_exc = None
+
+    if auth_exc and isinstance(e, auth_exc):
+        raise HTTPException(
+            status_code=401,
+            detail={
+                "error": "OpenRouter API Key Issue",
+                "message": "Authentication failed when calling the OpenRouter/OpenAI API (invalid or inactive API key).",
+                "solutions": [
+                    "1. Verify your OPENROUTER_API_KEY is present in your .env or environment variables",
+                    "2. Check the key is active at https://openrouter.ai/settings/keys",
+                    "3. Ensure your account has access and credits at https://openrouter.ai/credits",
+                    "4. If using a rotated key, update the .env and restart the server"
+                ],
+                "help_links": {
+                    "keys": "https://openrouter.ai/settings/keys",
+                    "credits": "https://openrouter.ai/credits",
+                    "activity": "https://openrouter.ai/activity"
+                }
+            }
+        )
+
+    error_str = str(e)
+
+    # our own rate limiter's queue is too long right now
+    if isinstance(e, RateLimitWaitTooLong):
+        raise HTTPException(
+            status_code=429,
+            detail={
+                "error": "Rate Limited",
+                "message": str(e),
+                "help": "Too many generations are waiting for the model right now. Retry after the Retry-After header."
+            },
+            headers={"Retry-After": str(max(math.ceil(e.wait), 1))}
+        )
+
+    # rate limited or circuit open even after retries and fallbacks - the client
+    # can just try again later, this isn't a billing problem
+    if isinstance(e, CircuitOpenError) or (is_retryable(e) and "quota" not in error_str.lower()):
+        wait = e.retry_in if isinstance(e, CircuitOpenError) else retry_after(e)
+        raise HTTPException(
+            status_code=429 if getattr(e, "status_code", None) == 429 else 503,
+            detail={
+                "error": "LLM Provider Unavailable",
+                "message": f"The model provider is rate limiting or failing right now, even after retries: {error_str}",
+                "help": "Try again shortly. Configure <AGENT>_FALLBACK_MODELS to fall back to other models."
+            },
+            headers={"Retry-After": str(max(int(wait or 30), 1))}
+        )
+
+    # handle different error types
+    if "insufficient_quota" in error_str or "429" in error_str or "quota" in error_str.lower():
+        raise HTTPException(
+            status_code=402,  # Payment Required
+            detail={
+                "error": "API Quota Exceeded",
+                "message": "You've exceeded your API quota or need to set up billing.",
+                "solutions": [
+                    "1. Check your OpenRouter account credits: https://openrouter.ai/credits",
+                    "2. Add credits if needed: https://openrouter.ai/credits",
+                    "3. Check your usage: https://openrouter.ai/activity",
+                    "4. Wait for your quota to reset, or add more credits"
+                ],
+                "help_links": {
+                    "credits": "https://openrouter.ai/credits",
+                    "activity": "https://openrouter.ai/activity",
+                    "keys": "https://openrouter.ai/keys"
+                }
+            }
+        )
+    elif "api_key" in error_str.lower() or "authentication" in error_str.lower() or "unauthorized" in error_str.lower() or "user not found" in error_str.lower():
+        # Fallback for providers that return message text
+        raise HTTPException(
+            status_code=401,  # Unauthorized
+            detail={
+                "error": "OpenRouter API Key Issue",
+                "message": "There's a problem with your OpenRouter API key.",
+                "solutions": [
+                    "1. Verify your API key is correct in the .env file",
+                    "2. Check if your API key is active: https://openrouter.ai/settings/keys",
+                    "3. Make sure you've set OPENROUTER_API_KEY in your .env file (not OPENAI_API_KEY)",
+                    "4. Get your API key from: https://openrouter.ai/settings/keys"
+                ],
+                "help_links": {
+                    "keys": "https://openrouter.ai/settings/keys",
+                    "credits": "https://openrouter.ai/credits",
+                    "activity": "https://openrouter.ai/activity"
+                }
+            }
+        )
+    else:
+        raise HTTPException(
+            status_code=500, 
+            detail={
+                "error": "Processing Error",
+                "message": str(e),
+                "help": "Check the error message above for details. If the issue persists, verify your OpenRouter API key and account status at https://openrouter.ai/settings/keys"
+            }
+        )
 
 @router.post("/generate", response_model=TaskResponse, summary="Generate code using multi-agent system")
-def generate_code(request: TaskRequest):
+async def generate_code(request: TaskRequest):
     """
     Main endpoint - runs the multi-agent workflow to generate code.
     
@@ -35,101 +325,284 @@ def generate_code(request: TaskRequest):
     4. Reviewer - reviews everything
     5. Manager - decides approve/rewrite
     
-    If manager says rewrite, it loops back to coder.
+    If manager says rewrite, it loops back to coder - up to max_iterations
+    times, or until the time/token budget runs out. If a rewrite comes back
+    unchanged the loop stops early. stop_reason in the response says why.
+
+    With topology "parallel", steps 3 and 4 run at the same time and the
+    reviewer only looks at the code.
     """
+    hit = await asyncio.to_thread(semantic_lookup, request)
+    if hit and hit[0] == "result":
+        # close enough to an approved earlier run, no llm calls at all
+        return TaskResponse(**{**hit[1]["result"], "run_id": None, "tokens_used": 0,
+                               "timings": [], "semantic_match": hit[2]})
+
+    await ensure_ready()
+    if hit:
+        # similar but not the same - start from its architecture, skipping the architect
+        result = hit[1]["result"]
+        state = initial_state(request, architecture=result["architecture"],
+                              architecture_spec=result.get("architecture_spec"))
+    else:
+        state = initial_state(request)
+    check_admission(state)
+    config = run_config(state)
     try:
-        # run the agent workflow
-        result = agent_app.invoke({
-            "task": request.task
-        })
-
-        return TaskResponse(
-            architecture=result.get("architecture", ""),
-            code=result.get("code", ""),
-            tests=result.get("tests", ""),
-            review=result.get("review", ""),
-            final_decision=result.get("decision", "")
-        )
+        # run the agent workflow without tying up a worker thread
+        async with _generation_slots:
+            result = await get_app(request.topology).ainvoke(state, config=config)
+
+        await afinish_run(run_id_of(config))
+        response = task_response(result, run_id_of(config))
+        if request.semantic_cache and response.final_decision == "approve":
+            from agents.semantic_cache import remember
+            await asyncio.to_thread(remember, request.task, semantic_fingerprint(request),
+                                    response.model_dump(exclude={"run_id", "semantic_match"}))
+        if hit:
+            response.semantic_match = hit[2]
+        return response
     except Exception as e:
-        # Check for OpenAI/OpenRouter authentication errors and map them to 401
-        try:
-            import openai
-            # Support both openai.AuthenticationError and openai.error.AuthenticationError
-            auth_exc = getattr(openai, 'AuthenticationError', None)
-            if auth_exc is None and hasattr(openai, 'error'):
-                auth_exc = getattr(openai.error, 'AuthenticationError', None)
-        except Exception:
-            auth_exc = None
-
-        if auth_exc and isinstance(e, auth_exc):
-            raise HTTPException(
-                status_code=401,
-                detail={
-                    "error": "OpenRouter API Key Issue",
-                    "message": "Authentication failed when calling the OpenRouter/OpenAI API (invalid or inactive API key).",
-                    "solutions": [
-                        "1. Verify your OPENROUTER_API_KEY is present in your .env or environment variables",
-                        "2. Check the key is active at https://openrouter.ai/settings/keys",
-                        "3. Ensure your account has access and credits at https://openrouter.ai/credits",
-                        "4. If using a rotated key, update the .env and restart the server"
-                    ],
-                    "help_links": {
-                        "keys": "https://openrouter.ai/settings/keys",
-                        "credits": "https://openrouter.ai/credits",
-                        "activity": "https://openrouter.ai/activity"
-                    }
-                }
-            )
-
-        error_str = str(e)
-        
-        # handle different error types
-        if "insufficient_quota" in error_str or "429" in error_str or "quota" in error_str.lower():
-            raise HTTPException(
-                status_code=402,  # Payment Required
-                detail={
-                    "error": "API Quota Exceeded",
-                    "message": "You've exceeded your API quota or need to set up billing.",
-                    "solutions": [
-                        "1. Check your OpenRouter account credits: https://openrouter.ai/credits",
-                        "2. Add credits if needed: https://openrouter.ai/credits",
-                        "3. Check your usage: https://openrouter.ai/activity",
-                        "4. Wait for your quota to reset, or add more credits"
-                    ],
-                    "help_links": {
-                        "credits": "https://openrouter.ai/credits",
-                        "activity": "https://openrouter.ai/activity",
-                        "keys": "https://openrouter.ai/keys"
-                    }
-                }
-            )
-        elif "api_key" in error_str.lower() or "authentication" in error_str.lower() or "unauthorized" in error_str.lower() or "user not found" in error_str.lower():
-            # Fallback for providers that return message text
-            raise HTTPException(
-                status_code=401,  # Unauthorized
-                detail={
-                    "error": "OpenRouter API Key Issue",
-                    "message": "There's a problem with your OpenRouter API key.",
-                    "solutions": [
-                        "1. Verify your API key is correct in the .env file",
-                        "2. Check if your API key is active: https://openrouter.ai/settings/keys",
-                        "3. Make sure you've set OPENROUTER_API_KEY in your .env file (not OPENAI_API_KEY)",
-                        "4. Get your API key from: https://openrouter.ai/settings/keys"
-                    ],
-                    "help_links": {
-                        "keys": "https://openrouter.ai/settings/keys",
-                        "credits": "https://openrouter.ai/credits",
-                        "activity": "https://openrouter.ai/activity"
-                    }
-                }
-            )
+        raise_run_error(e, run_id_of(config))
+
+
+# graph nodes we report progress for in the stream
+STREAM_STAGES = ("architect", "coder", "candidates", "tester", "executor", "reviewer", "manager")
+
+def sse_event(event, data):
+    # one server-sent event
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def http_error_payload(e, run_id=None):
+    # same mapping as raise_api_error, but as data we can send mid-stream
+    try:
+        raise_run_error(e, run_id)
+    except HTTPException as http_exc:
+        return {"status_code": http_exc.status_code, "detail": http_exc.detail}
+
+@router.post("/generate/stream", summary="Generate code and stream each agent's output")
+async def generate_code_stream(request: TaskRequest):
+    """
+    Same workflow as /generate, but streamed as server-sent events:
+
+    - stage_start: an agent started (`{"stage": "coder"}`)
+    - token: a piece of the agent's output (`{"stage": "coder", "delta": "..."}`)
+    - stage_complete: an agent finished, with its state update
+    - done: the final result, same shape as the /generate response
+    - error: something failed (`{"status_code": ..., "detail": ...}`)
+    """
+    await ensure_ready()
+    # rejected before the stream starts, so it's a real 429
+    check_admission(initial_state(request))
+
+    async def events():
+        async with _generation_slots:
+            state = initial_state(request)
+            config = run_config(state)
+            try:
+                result = {}
+                async for event in get_app(request.topology).astream_events(
+                    state, config=config, version="v2"
+                ):
+                    kind = event["event"]
+                    stage = event.get("metadata", {}).get("langgraph_node")
+
+                    if kind == "on_chain_start" and event["name"] in STREAM_STAGES and stage == event["name"]:
+                        yield sse_event("stage_start", {"stage": stage})
+                    elif kind == "on_chat_model_stream" and stage in STREAM_STAGES:
+                        delta = event["data"]["chunk"].content
+                        if delta:
+                            yield sse_event("token", {"stage": stage, "delta": delta})
+                    elif kind == "on_chain_end" and event["name"] in STREAM_STAGES and stage == event["name"]:
+                        yield sse_event("stage_complete", {"stage": stage, "output": event["data"].get("output") or {}})
+                    elif kind == "on_chain_end" and not event.get("parent_ids"):
+                        # the graph itself finished - this is the final state
+                        result = event["data"].get("output") or {}
+
+                await afinish_run(run_id_of(config))
+                yield sse_event("done", task_response(result, run_id_of(config)).model_dump())
+            except Exception as e:
+                yield sse_event("error", http_error_payload(e, run_id_of(config)))
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+class JobSubmitted(BaseModel):
+    job_id: str
+    status: str
+    status_url: str
+
+class JobStatus(BaseModel):
+    job_id: str
+    # resume a failed job's run with POST /runs/{run_id}/resume
+    run_id: Optional[str] = None
+    tenant: str
+    status: str
+    stage: Optional[str] = None
+    # partial AgentState - fills in as each agent finishes
+    state: dict
+    result: Optional[TaskResponse] = None
+    error: Optional[dict] = None
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+job_manager = JobManager(get_app, format_error=http_error_payload, **get_job_settings())
+
+def job_status(job):
+    data = job.to_dict()
+    if job.status == SUCCEEDED:
+        data["result"] = task_response(job.state, job.run_id)
+    return JobStatus(**data)
+
+def get_job_or_404(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(
+            status_code=404,
+            detail={
+                "error": "Job Not Found",
+                "message": f"No job with id '{job_id}'. Finished jobs are only kept for a limited time."
+            }
+        )
+    return job
+
+@router.post("/jobs", response_model=JobSubmitted, status_code=202, summary="Queue a code generation job")
+async def submit_job(request: TaskRequest, x_tenant_id: str = Header("default")):
+    """
+    Queues the multi-agent workflow and returns a job id right away.
+    Poll GET /api/v1/jobs/{job_id} for progress and the result.
+
+    Jobs are shared fairly between tenants (the X-Tenant-ID header).
+    """
+    await ensure_ready()
+    try:
+        state = initial_state(request)
+        job = await job_manager.submit(
+            state, tenant=x_tenant_id, topology=request.topology, config=run_config(state)
+        )
+    except QueueFullError as e:
+        raise HTTPException(
+            status_code=429,
+            detail={"error": "Too Many Jobs", "message": str(e)},
+            headers={"Retry-After": "30"}
+        )
+    return JobSubmitted(job_id=job.id, status=job.status, status_url=f"{router.prefix}/jobs/{job.id}")
+
+@router.get("/jobs/{job_id}", response_model=JobStatus, summary="Get job status and result")
+async def get_job(job_id: str):
+    return job_status(get_job_or_404(job_id))
+
+@router.post("/jobs/{job_id}/cancel", response_model=JobStatus, summary="Cancel a queued or running job")
+async def cancel_job(job_id: str):
+    get_job_or_404(job_id)
+    return job_status(job_manager.cancel(job_id))
+
+
+class BatchRequest(RunSettings):
+    tasks: List[str] = Field(..., min_length=1, max_length=1000)
+    # how many of this batch's tasks run at once
+    concurrency: int = Field(4, ge=1, le=64)
+    # optional architecture shared by every task, skips the architect agent
+    architecture: Optional[str] = None
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "tasks": [
+                    "Create a Python function to calculate fibonacci numbers",
+                    "Create a Python function to check if a number is prime"
+                ],
+                "concurrency": 4
+            }
+        }
+
+@router.post("/generate/batch", summary="Generate code for many tasks, streamed back as NDJSON")
+async def generate_batch(request: BatchRequest):
+    """
+    Runs every task through the multi-agent workflow, at most `concurrency`
+    at a time. Each result is written as one JSON line as soon as it's done,
+    so lines come back in completion order - use `index` to match them up.
+
+    Identical tasks in the batch are only generated once; the copies get the
+    same result with `duplicate_of` pointing at the first one.
+    """
+    await ensure_ready()
+    # dedupe - the same task (ignoring surrounding whitespace) runs once
+    first_index = {}
+    duplicates = {}
+    for index, task in enumerate(request.tasks):
+        key = task.strip()
+        if key in first_index:
+            duplicates.setdefault(first_index[key], []).append(index)
         else:
-            raise HTTPException(
-                status_code=500, 
-                detail={
-                    "error": "Processing Error",
-                    "message": str(e),
-                    "help": "Check the error message above for details. If the issue persists, verify your OpenRouter API key and account status at https://openrouter.ai/settings/keys"
-                }
-            )
+            first_index[key] = index
+
+    batch_slots = asyncio.Semaphore(request.concurrency)
+
+    async def run_one(index):
+        task = request.tasks[index]
+        async with batch_slots, _generation_slots:
+            state = initial_state(request, task=task, architecture=request.architecture)
+            config = run_config(state)
+            try:
+                result = await get_app(request.topology).ainvoke(state, config=config)
+                await afinish_run(run_id_of(config))
+                return index, {"status": "ok", "result": task_response(result, run_id_of(config)).model_dump()}
+            except Exception as e:
+                return index, {"status": "error", "error": http_error_payload(e, run_id_of(config))}
 
+    async def lines():
+        pending = [asyncio.create_task(run_one(index)) for index in first_index.values()]
+        try:
+            for finished in asyncio.as_completed(pending):
+                index, outcome = await finished
+                yield json.dumps({"index": index, "task": request.tasks[index], **outcome}) + "\n"
+                for copy in duplicates.get(index, []):
+                    yield json.dumps({
+                        "index": copy, "task": request.tasks[copy], "duplicate_of": index, **outcome
+                    }) + "\n"
+        finally:
+            # client went away - don't keep generating for nobody
+            for task in pending:
+                task.cancel()
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@router.post("/runs/{run_id}/resume", response_model=TaskResponse, summary="Resume a failed run")
+async def resume_run(run_id: str):
+    """
+    Picks a failed or interrupted run back up from its last checkpoint.
+    Agents that already finished aren't run (or paid for) again - only the
+    one that failed and everything after it.
+
+    The run id comes back in the error of a failed /generate, stream, batch
+    or job. Failed runs can be resumed for CHECKPOINT_TTL seconds.
+    """
+    await ensure_ready()
+    saved = saved_run(run_id)
+    if saved is None:
+        raise HTTPException(
+            status_code=404,
+            detail={
+                "error": "Run Not Found",
+                "message": f"No checkpoint for run '{run_id}'. Finished runs aren't kept, failed ones expire."
+            }
+        )
+    graph, state = saved
+    config = run_config(state, run_id)
+    try:
+        async with _generation_slots:
+            snapshot = await graph.aget_state(config)
+            # nothing left to run means it finished, just not cleaned up yet
+            result = await graph.ainvoke(None, config=config) if snapshot.next else snapshot.values
+
+        await afinish_run(run_id)
+        return task_response(result, run_id)
+    except Exception as e:
+        raise_run_error(e, run_id)
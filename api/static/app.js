@@ -0,0 +1,155 @@
+const form = document.getElementById('codeForm');
+const submitBtn = document.getElementById('submitBtn');
+const loading = document.getElementById('loading');
+const result = document.getElementById('result');
+const error = document.getElementById('error');
+const workflowBtn = document.getElementById('workflowBtn');
+const workflowModal = document.getElementById('workflowModal');
+const closeWorkflow = document.getElementById('closeWorkflow');
+
+// Workflow modal handlers
+workflowBtn.addEventListener('click', (e) => {
+    e.preventDefault();
+    workflowModal.classList.add('show');
+});
+
+closeWorkflow.addEventListener('click', () => {
+    workflowModal.classList.remove('show');
+});
+
+workflowModal.addEventListener('click', (e) => {
+    if (e.target === workflowModal) {
+        workflowModal.classList.remove('show');
+    }
+});
+
+// which <pre> each agent's output goes into
+const stageOutputs = {
+    architect: 'architecture',
+    coder: 'code',
+    tester: 'tests',
+    reviewer: 'review',
+    manager: 'decision'
+};
+
+function showError(detail, fallback) {
+    // Handle structured error responses
+    if (detail && typeof detail === 'object' && detail.error) {
+        let errorHtml = `<h4>${detail.error}</h4>`;
+        errorHtml += `<p><strong>${detail.message}</strong></p>`;
+
+        if (detail.solutions && Array.isArray(detail.solutions)) {
+            errorHtml += '<div class="solutions"><strong>Solutions:</strong><ul>';
+            detail.solutions.forEach(solution => {
+                errorHtml += `<li>${solution}</li>`;
+            });
+            errorHtml += '</ul></div>';
+        }
+
+        if (detail.help_links) {
+            errorHtml += '<div class="help-links"><strong>Helpful Links:</strong><br>';
+            Object.entries(detail.help_links).forEach(([name, url]) => {
+                errorHtml += `<a href="${url}" target="_blank">${name}</a>`;
+            });
+            errorHtml += '</div>';
+        }
+
+        error.innerHTML = errorHtml;
+    } else {
+        error.innerHTML = `<h4>Error</h4><p>${detail || fallback || 'Failed to generate code'}</p>`;
+    }
+    error.style.display = 'block';
+}
+
+function handleEvent(name, data) {
+    if (name === 'stage_start') {
+        // a rewrite loop restarts the coder, so clear its old output
+        const pre = document.getElementById(stageOutputs[data.stage]);
+        if (pre) pre.textContent = '';
+        loading.querySelector('p').textContent = `The ${data.stage} is working on it...`;
+        result.classList.add('show');
+    } else if (name === 'token') {
+        const pre = document.getElementById(stageOutputs[data.stage]);
+        if (pre) pre.textContent += data.delta;
+    } else if (name === 'stage_complete') {
+        // cached answers arrive without tokens, so fill in from the output
+        const key = stageOutputs[data.stage];
+        const value = data.output[key];
+        if (value) document.getElementById(key).textContent = value;
+    } else if (name === 'done') {
+        document.getElementById('architecture').textContent = data.architecture || 'N/A';
+        document.getElementById('code').textContent = data.code || 'N/A';
+        document.getElementById('tests').textContent = data.tests || 'N/A';
+        document.getElementById('review').textContent = data.review || 'N/A';
+        document.getElementById('decision').textContent = data.final_decision || 'N/A';
+        result.classList.add('show');
+    } else if (name === 'error') {
+        showError(data.detail);
+    }
+}
+
+form.addEventListener('submit', async (e) => {
+    e.preventDefault();
+
+    const task = document.getElementById('task').value;
+
+    // Reset UI
+    result.classList.remove('show');
+    error.style.display = 'none';
+    loading.classList.add('show');
+    submitBtn.disabled = true;
+    Object.values(stageOutputs).forEach(id => {
+        document.getElementById(id).textContent = '';
+    });
+
+    try {
+        const response = await fetch('/api/v1/generate/stream', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({ task })
+        });
+
+        if (!response.ok) {
+            const errorData = await response.json();
+            showError(errorData.detail);
+            return;
+        }
+
+        // read the server-sent events as they arrive
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            // proxies may rewrite the line endings, the events are split on \n\n
+            // (a \r at the very end waits for the next chunk, it may be half of a \r\n)
+            buffer = (buffer + decoder.decode(value, { stream: true })).replace(/\r\n|\r(?=.)/gs, '\n');
+
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const raw = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+
+                let name = 'message';
+                let data = '';
+                raw.split('\n').forEach(line => {
+                    if (line.startsWith('event: ')) name = line.slice(7);
+                    else if (line.startsWith('data: ')) data += line.slice(6);
+                });
+                if (data) handleEvent(name, JSON.parse(data));
+            }
+        }
+
+    } catch (err) {
+        error.innerHTML = `<h4>Error</h4><p>${err.message || 'An unexpected error occurred'}</p>`;
+        error.style.display = 'block';
+    } finally {
+        loading.classList.remove('show');
+        loading.querySelector('p').textContent = 'Our agents are working on it...';
+        submitBtn.disabled = false;
+    }
+});
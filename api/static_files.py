@@ -0,0 +1,144 @@
+# serves the web ui (api/static) with caching and compression
+# the page used to be a big html string built inside root() on every request,
+# sent uncompressed and without any caching headers. now the files are served
+# with an ETag (so repeat visits get a 304) and a Cache-Control header, and
+# browsers that accept it get a gzip/brotli copy compressed once on startup
+import gzip
+import mimetypes
+import os
+
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.responses import FileResponse
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+from config import get_static_settings
+
+try:
+    import brotli  # optional, pip install brotli
+except ImportError:
+    brotli = None
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+
+COMPRESSIBLE = (".html", ".css", ".js", ".json", ".svg", ".txt")
+
+# content-encoding -> file suffix, in order of preference
+VARIANTS = {"br": ".br", "gzip": ".gz"}
+
+
+def _compress(data, encoding):
+    if encoding == "br":
+        return brotli.compress(data, quality=11)
+    return gzip.compress(data, compresslevel=9, mtime=0)  # mtime=0 so the output doesn't change
+
+
+def precompress(directory=STATIC_DIR):
+    # write a .gz/.br copy next to every compressible file that doesn't have an
+    # up to date one. returns how many were written
+    encodings = ["gzip"] + (["br"] if brotli else [])
+    written = 0
+    for folder, _, names in os.walk(directory):
+        for name in names:
+            if not name.endswith(COMPRESSIBLE):
+                continue
+            path = os.path.join(folder, name)
+            mtime = os.stat(path).st_mtime
+            data = None
+            for encoding in encodings:
+                target = path + VARIANTS[encoding]
+                if os.path.exists(target) and os.stat(target).st_mtime >= mtime:
+                    continue
+                if data is None:
+                    with open(path, "rb") as f:
+                        data = f.read()
+                # several workers can do this at once, so write to a temp file first
+                tmp = f"{target}.{os.getpid()}.tmp"
+                with open(tmp, "wb") as f:
+                    f.write(_compress(data, encoding))
+                os.replace(tmp, target)
+                written += 1
+    return written
+
+
+def accepted_encodings(header):
+    # {encoding: q} from an Accept-Encoding header
+    accepted = {}
+    for part in (header or "").split(","):
+        name, _, params = part.strip().partition(";")
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+    return accepted
+
+
+class CachedStaticFiles(StaticFiles):
+    # StaticFiles already answers If-None-Match/If-Modified-Since with a 304,
+    # this adds Cache-Control and picks a precompressed copy when there is one
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        request_headers = Headers(scope=scope)
+        headers = {"Cache-Control": self.cache_control(full_path)}
+        media_type = mimetypes.guess_type(str(full_path))[0] or "text/plain"
+
+        path, encoding = str(full_path), None
+        if path.endswith(COMPRESSIBLE):
+            headers["Vary"] = "Accept-Encoding"
+            path, encoding, stat_result = self.pick_variant(path, stat_result, request_headers)
+        if encoding:
+            headers["Content-Encoding"] = encoding
+
+        # the variant's own size and mtime go into the ETag, so each encoding has a different one
+        response = FileResponse(path, status_code=status_code, headers=headers,
+                                media_type=media_type, stat_result=stat_result)
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+    def pick_variant(self, path, stat_result, request_headers):
+        accepted = accepted_encodings(request_headers.get("accept-encoding"))
+        for encoding, suffix in VARIANTS.items():
+            if accepted.get(encoding, accepted.get("*", 0)) <= 0:
+                continue
+            try:
+                variant = os.stat(path + suffix)
+            except OSError:
+                continue
+            # a copy older than the file is stale (file edited, precompress not rerun)
+            if variant.st_mtime >= stat_result.st_mtime:
+                return path + suffix, encoding, variant
+        return path, None, stat_result
+
+    def cache_control(self, path):
+        if str(path).endswith(".html"):
+            return "no-cache"  # always revalidate, so a new deploy shows up right away
+        max_age = get_static_settings()["max_age"]
+        return f"public, max-age={max_age}" if max_age > 0 else "no-cache"
+
+
+class StreamingSafeGZipMiddleware(GZipMiddleware):
+    # GZipMiddleware that leaves the streaming routes alone. older starlette
+    # versions gzip event streams too, and buffer every chunk until the
+    # compressor has a block to emit - the client then sees nothing until the
+    # run is over. path prefixes in `skip` are passed straight through
+
+    def __init__(self, app, skip=(), **options):
+        super().__init__(app, **options)
+        self.passthrough = app
+        self.skip = tuple(skip)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"].startswith(self.skip):
+            await self.passthrough(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+
+static_files = CachedStaticFiles(directory=STATIC_DIR)
@@ -0,0 +1,160 @@
+# deterministic stand-in for the OpenRouter models, so we can benchmark the
+# pipeline itself without paying for real calls
+# every reply carries the run tag from the task ("[run:7]") so the scripted
+# manager decisions can be tracked per run even with many runs in flight
+import asyncio
+import json
+import re
+import threading
+import time
+from collections import defaultdict
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from agents.edits import EDIT_FORMAT
+
+RUN_TAG = re.compile(r"\[run:[^\]]+\]")
+VERSION_LINE = re.compile(r"(# \[run:[^\]]+\] version )(\d+)")
+
+
+class FakeChatModel(BaseChatModel):
+    # latency = seconds until the first token, tokens_per_second = streaming speed
+    latency: float = 0.05
+    tokens_per_second: float = 200.0
+    output_tokens: int = 50
+    # manager (or structured reviewer) decisions for each run, in order (the last one repeats)
+    decisions: tuple = ("approve",)
+
+    @property
+    def _llm_type(self):
+        return "fake-benchmark"
+
+    def model_post_init(self, __context):
+        self._manager_calls = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def _next_decision(self, tag):
+        with self._lock:
+            index = self._manager_calls[tag]
+            self._manager_calls[tag] += 1
+        return self.decisions[min(index, len(self.decisions) - 1)]
+
+    def _reply(self, prompt):
+        reply = self._text_reply(prompt)
+        schema = re.search(r"JSON object \(no markdown, no prose\) for (\w+)", prompt)
+        if not schema:
+            return reply
+        return json.dumps(self._structured_reply(schema.group(1), prompt, reply))
+
+    def _structured_reply(self, schema, prompt, reply):
+        # the same answers, shaped like agents/schemas.py
+        tag_match = RUN_TAG.search(prompt)
+        tag = tag_match.group(0) if tag_match else "[run:?]"
+        code = reply.replace("```python\n", "").replace("```", "")
+        if schema == "ArchitectOutput":
+            return {
+                "summary": reply,
+                "components": [{"name": "solution", "responsibility": reply}],
+                "interfaces": [{"name": "solution", "signature": "def solution(n)", "description": ""}]
+            }
+        if schema == "CoderOutput":
+            return {"files": [{"path": "solution.py", "content": code}]}
+        if schema == "TesterOutput":
+            return {"files": [{"path": "test_solution.py", "content": code}]}
+        # the reviewer's verdict follows the script, so the manager can decide locally
+        return {"summary": reply, "issues": [], "changes_required": self._next_decision(tag) == "rewrite"}
+
+    def _text_reply(self, prompt):
+        tag_match = RUN_TAG.search(prompt)
+        tag = tag_match.group(0) if tag_match else "[run:?]"
+        filler = " ".join(["lorem"] * self.output_tokens)
+
+        if "Reply with ONLY one word" in prompt:
+            return self._next_decision(tag)
+
+        if "Reply ONLY with the edits" in prompt:
+            # bump the version line so the rewrite isn't seen as converged
+            match = VERSION_LINE.search(prompt)
+            if match:
+                old = match.group(0)
+                new = f"{match.group(1)}{int(match.group(2)) + 1}"
+                return EDIT_FORMAT \
+                    .replace("(exact lines from the current code)", old) \
+                    .replace("(the new lines)", new)
+
+        if "Write Python code" in prompt or "Reply ONLY with the edits" in prompt:
+            # a full rewrite is shown the rejected code, answer with the next version
+            match = VERSION_LINE.search(prompt)
+            version = int(match.group(2)) + 1 if match and "previous version was rejected" in prompt else 1
+            return (
+                f"```python\n# {tag} version {version}\n# {filler}\n"
+                "def solution(n):\n    return n\n```"
+            )
+
+        if "pytest" in prompt:
+            return (
+                f"```python\n# {tag} {filler}\nfrom solution import solution\n\n"
+                "def test_solution():\n    assert solution(1) == 1\n```"
+            )
+
+        return f"{tag} {filler}"
+
+    def _tokens(self, messages):
+        prompt = "\n".join(str(message.content) for message in messages)
+        reply = self._reply(prompt)
+        # keep whitespace attached so the chunks join back into the same text
+        tokens = re.findall(r"\S+\s*|\s+", reply) or [""]
+        usage = {
+            "input_tokens": len(prompt.split()),
+            "output_tokens": len(tokens),
+            "total_tokens": len(prompt.split()) + len(tokens)
+        }
+        return tokens, usage
+
+    def _chunks(self, tokens, usage):
+        for i, token in enumerate(tokens):
+            last = i == len(tokens) - 1
+            yield ChatGenerationChunk(message=AIMessageChunk(
+                content=token, usage_metadata=usage if last else None
+            ))
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        tokens, usage = self._tokens(messages)
+        time.sleep(self.latency + len(tokens) / self.tokens_per_second)
+        message = AIMessage(content="".join(tokens), usage_metadata=usage)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        tokens, usage = self._tokens(messages)
+        time.sleep(self.latency)
+        for chunk in self._chunks(tokens, usage):
+            time.sleep(1 / self.tokens_per_second)
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        tokens, usage = self._tokens(messages)
+        await asyncio.sleep(self.latency)
+        for chunk in self._chunks(tokens, usage):
+            await asyncio.sleep(1 / self.tokens_per_second)
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        tokens, usage = self._tokens(messages)
+        await asyncio.sleep(self.latency + len(tokens) / self.tokens_per_second)
+        message = AIMessage(content="".join(tokens), usage_metadata=usage)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+def install_fake_llm(**settings):
+    # make every agent use one shared FakeChatModel
+    from agents.llm import set_llm_factory
+
+    model = FakeChatModel(**settings)
+    set_llm_factory(lambda *args, **kwargs: model)
+    return model
@@ -0,0 +1,153 @@
+"""
+Cold start profile: how long importing the app takes, and what it spends it on
+
+Each measurement runs in a fresh interpreter with `python -X importtime`, so
+nothing is cached from an earlier import. Also times loading the pipeline
+(importing and compiling the agent graphs), which happens after startup.
+
+    python -m benchmarks.import_profile
+    python -m benchmarks.import_profile --json --max-import-ms 800   # for CI
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMPORT_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+# prints how long loading the pipeline takes once the app is imported
+WARM_UP = """
+import time
+import api.main
+from orchestration.pipeline import warm_up
+started = time.perf_counter()
+warm_up()
+print("PIPELINE_SECONDS", time.perf_counter() - started)
+"""
+
+
+def _run(code, importtime=False):
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", code]
+    env = {**os.environ, "PYTHONPATH": ROOT, "PYTHONDONTWRITEBYTECODE": "1", "OPENROUTER_API_KEY": "profile"}
+    # memory-only checkpoints, so the profile doesn't depend on what's in checkpoints.db
+    env.setdefault("CHECKPOINT_SQLITE_PATH", "")
+    process = subprocess.run(command, cwd=ROOT, env=env, capture_output=True, text=True)
+    if process.returncode:
+        raise RuntimeError(f"profiling failed:\n{process.stderr[-2000:]}")
+    return process
+
+
+def profile_import(module):
+    # [(module, self us, cumulative us, depth)] for one cold import, in the
+    # order python -X importtime prints them (a module after its own imports)
+    stderr = _run(f"import {module}", importtime=True).stderr
+    imports = []
+    for line in stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            imports.append((match.group(4), int(match.group(1)), int(match.group(2)), len(match.group(3)) // 2))
+    return imports
+
+
+def direct_imports(imports, module):
+    # what `module` imports itself: the depth 1 entries right before it
+    names = [entry[0] for entry in imports]
+    if module not in names:
+        return []
+    direct = []
+    for name, _, cumulative, depth in reversed(imports[:names.index(module)]):
+        if depth == 0:
+            break
+        if depth == 1:
+            direct.append((name, cumulative))
+    return direct
+
+
+def _import_us(imports, module):
+    return next((cumulative for name, _, cumulative, _ in imports if name == module), 0)
+
+
+def pipeline_seconds():
+    stdout = _run(WARM_UP).stdout
+    for line in stdout.splitlines():
+        if line.startswith("PIPELINE_SECONDS"):
+            return float(line.split()[1])
+    return None
+
+
+def build_report(module, runs, top):
+    # best of `runs` cold imports, since the first one also warms the disk cache
+    profiles = [profile_import(module) for _ in range(runs)]
+    imports = min(profiles, key=lambda p: _import_us(p, module))
+    loaded = {entry[0] for entry in imports}
+
+    packages = defaultdict(int)
+    for name, self_us, _, _ in imports:
+        packages[name.split(".")[0]] += self_us
+
+    return {
+        "module": module,
+        "import_ms": round(_import_us(imports, module) / 1000, 1),
+        "modules_imported": len(imports),
+        # by top-level package, what the import spends its time on
+        "packages_ms": {
+            name: round(us / 1000, 1)
+            for name, us in sorted(packages.items(), key=lambda item: -item[1])[:top]
+        },
+        # modules imported directly by `module`, with everything they import
+        "slowest_direct_imports_ms": {
+            name: round(us / 1000, 1)
+            for name, us in sorted(direct_imports(imports, module), key=lambda item: -item[1])[:top]
+        },
+        # heavy modules that should only load with the pipeline
+        "loaded_at_import": sorted(
+            name for name in ("orchestration.graph", "langgraph", "langchain_openai", "langchain_core")
+            if name in loaded
+        ),
+        "pipeline_load_seconds": round(pipeline_seconds(), 3)
+    }
+
+
+def print_report(report):
+    print(f"\nimport {report['module']}: {report['import_ms']} ms, {report['modules_imported']} modules imported")
+    print("\n  by package:")
+    for name, ms in report["packages_ms"].items():
+        print(f"    {name:<30} {ms:>8} ms")
+    print("\n  slowest direct imports (cumulative):")
+    for name, ms in report["slowest_direct_imports_ms"].items():
+        print(f"    {name:<30} {ms:>8} ms")
+    if report["loaded_at_import"]:
+        print(f"\n  WARNING: loaded at import time: {', '.join(report['loaded_at_import'])}")
+    print(f"\n  pipeline load (graphs imported + compiled): {report['pipeline_load_seconds']}s")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Profile the app's import time")
+    parser.add_argument("--module", default="api.main")
+    parser.add_argument("--runs", type=int, default=3, help="cold imports to take the best of")
+    parser.add_argument("--top", type=int, default=12)
+    parser.add_argument("--max-import-ms", type=float, default=0,
+                        help="exit with status 1 if the import takes longer (0 = no limit)")
+    parser.add_argument("--json", action="store_true", help="print the report as json")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = build_report(args.module, max(args.runs, 1), args.top)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+    if args.max_import_ms and report["import_ms"] > args.max_import_ms:
+        print(f"\nimport took {report['import_ms']} ms, over the {args.max_import_ms} ms limit", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,189 @@
+"""
+Offline benchmark for the agent pipeline
+
+Runs the compiled graph (or the FastAPI app) under concurrent load with the
+fake LLM from benchmarks/fake_llm.py, so the numbers only measure our own
+orchestration overhead. Run from the project root:
+
+    python -m benchmarks.run_benchmarks --runs 200 --concurrency 50
+    python -m benchmarks.run_benchmarks --target api --topology parallel
+    python -m benchmarks.run_benchmarks --decisions rewrite,approve --json
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+import tracemalloc
+
+os.environ.setdefault("OPENROUTER_API_KEY", "benchmark-fake-key")
+# checkpoint in memory, not into ./checkpoints.db
+os.environ.setdefault("CHECKPOINT_SQLITE_PATH", "")
+# pytest startup would dwarf the orchestration overhead, --execute-tests turns it on
+os.environ.setdefault("SANDBOX_ENABLED", "false")
+# benchmark tasks only differ by run number, they'd all be semantic cache hits
+os.environ.setdefault("SEMANTIC_CACHE_ENABLED", "false")
+# the agents log every llm output, keep that out of the report
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from benchmarks.fake_llm import install_fake_llm
+from agents.cache import ResponseCache, set_response_cache
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+async def run_graph(index, args):
+    from orchestration.graph import finish_run, get_app, run_config, run_id_of
+    from orchestration.limits import initial_limits
+
+    state = {
+        "task": f"benchmark task [run:{index}]",
+        "rewrite_mode": args.rewrite_mode,
+        "candidates": args.candidates,
+        **initial_limits(args.max_iterations)
+    }
+    config = run_config(state)
+    await get_app(args.topology).ainvoke(state, config=config)
+    finish_run(run_id_of(config))
+
+
+async def run_api(index, args, client):
+    response = await client.post("/api/v1/generate", json={
+        "task": f"benchmark task [run:{index}]",
+        "topology": args.topology,
+        "rewrite_mode": args.rewrite_mode,
+        "max_iterations": args.max_iterations,
+        "candidates": args.candidates
+    })
+    response.raise_for_status()
+
+
+async def run_benchmark(args):
+    install_fake_llm(
+        latency=args.latency,
+        tokens_per_second=args.tokens_per_second,
+        output_tokens=args.output_tokens,
+        decisions=tuple(args.decisions.split(","))
+    )
+    if not args.cache:
+        # every run has a different task anyway, but don't let the cache skew things
+        set_response_cache(ResponseCache([]))
+
+    client = None
+    if args.target == "api":
+        import httpx
+        from api.main import app
+        client = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://benchmark", timeout=None
+        )
+
+    slots = asyncio.Semaphore(args.concurrency)
+    latencies = []
+    errors = 0
+
+    async def one(index):
+        nonlocal errors
+        async with slots:
+            started = time.perf_counter()
+            try:
+                if client is not None:
+                    await run_api(index, args, client)
+                else:
+                    await run_graph(index, args)
+                latencies.append(time.perf_counter() - started)
+            except Exception:
+                errors += 1
+
+    if args.memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    await asyncio.gather(*(one(index) for index in range(args.runs)))
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1] if args.memory else None
+    if args.memory:
+        tracemalloc.stop()
+    if client is not None:
+        await client.aclose()
+
+    report = {
+        "target": args.target,
+        "topology": args.topology,
+        "candidates": args.candidates,
+        "runs": args.runs,
+        "concurrency": args.concurrency,
+        "errors": errors,
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_runs_per_second": round(len(latencies) / elapsed, 3) if elapsed else 0.0,
+        "latency_seconds": {
+            "mean": round(statistics.mean(latencies), 4) if latencies else 0.0,
+            "p50": round(percentile(latencies, 50), 4),
+            "p95": round(percentile(latencies, 95), 4),
+            "p99": round(percentile(latencies, 99), 4)
+        }
+    }
+    if peak is not None:
+        # peak python allocations while runs were in flight, split across them
+        report["memory"] = {
+            "peak_bytes": peak,
+            "peak_bytes_per_concurrent_run": peak // min(args.concurrency, args.runs)
+        }
+    return report
+
+
+def print_report(report):
+    print(f"\n{report['target']} / {report['topology']}: "
+          f"{report['runs']} runs, concurrency {report['concurrency']}, {report['errors']} errors")
+    print(f"  elapsed:    {report['elapsed_seconds']}s")
+    print(f"  throughput: {report['throughput_runs_per_second']} runs/s")
+    latency = report["latency_seconds"]
+    print(f"  latency:    mean {latency['mean']}s  p50 {latency['p50']}s  "
+          f"p95 {latency['p95']}s  p99 {latency['p99']}s")
+    if "memory" in report:
+        memory = report["memory"]
+        print(f"  memory:     peak {memory['peak_bytes'] / 1024 / 1024:.1f} MiB, "
+              f"{memory['peak_bytes_per_concurrent_run'] / 1024:.1f} KiB per concurrent run")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the agent pipeline with a fake LLM")
+    parser.add_argument("--target", choices=["graph", "api"], default="graph",
+                        help="drive the compiled graph directly or the FastAPI app")
+    parser.add_argument("--topology", choices=["sequential", "parallel"], default="sequential")
+    parser.add_argument("--rewrite-mode", choices=["incremental", "full"], default="incremental")
+    parser.add_argument("--runs", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.05, help="fake seconds to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--output-tokens", type=int, default=50, help="filler tokens per reply")
+    parser.add_argument("--decisions", default="approve",
+                        help="manager decisions per run, e.g. rewrite,rewrite,approve")
+    parser.add_argument("--max-iterations", type=int, default=3)
+    parser.add_argument("--candidates", type=int, default=1, help="best-of-N code candidates per round")
+    parser.add_argument("--cache", action="store_true", help="keep the response cache on")
+    parser.add_argument("--execute-tests", action="store_true", help="run the generated tests in the sandbox")
+    parser.add_argument("--memory", action="store_true", help="track peak memory (slower)")
+    parser.add_argument("--json", action="store_true", help="print the report as json")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.execute_tests:
+        os.environ["SANDBOX_ENABLED"] = "true"
+    report = asyncio.run(run_benchmark(args))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+    return report
+
+
+if __name__ == "__main__":
+    main()
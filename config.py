@@ -1,5 +1,6 @@
 # config stuff - handles env vars
 import os
+import json
 from dotenv import load_dotenv
 
 load_dotenv()  # load .env file
@@ -20,3 +21,319 @@ def get_openrouter_model():
     # default model is gpt-4o-mini, can override in .env
     return os.getenv("OPENROUTER_MODEL", "openai/gpt-4o-mini")
 
+
+def _env_int(name, default):
+    # small helper so a bad value in .env doesn't crash the server
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+def _env_float(name, default):
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+def get_llm_pool_settings():
+    # connection pool used by the shared llm http client (see agents/llm.py)
+    return {
+        "max_connections": _env_int("LLM_POOL_MAX_CONNECTIONS", 100),
+        "max_keepalive_connections": _env_int("LLM_POOL_MAX_KEEPALIVE", 20),
+        "keepalive_expiry": _env_float("LLM_POOL_KEEPALIVE_EXPIRY", 30.0),
+        "connect_timeout": _env_float("LLM_CONNECT_TIMEOUT", 10.0),
+        "read_timeout": _env_float("LLM_READ_TIMEOUT", 120.0),
+    }
+
+def get_max_concurrent_generations():
+    # how many agent runs one server process will do at once
+    # (requests over the limit wait for a free slot)
+    return _env_int("MAX_CONCURRENT_GENERATIONS", 200)
+
+def get_llm_cache_settings():
+    # response cache for agent llm calls (see agents/cache.py)
+    return {
+        "enabled": os.getenv("LLM_CACHE_ENABLED", "true").lower() in ("1", "true", "yes"),
+        "max_entries": _env_int("LLM_CACHE_MAX_ENTRIES", 1024),
+        "ttl": _env_float("LLM_CACHE_TTL", 3600.0),
+        # leave empty to keep the cache in memory only
+        "sqlite_path": os.getenv("LLM_CACHE_SQLITE_PATH", ""),
+    }
+
+def get_job_settings():
+    # background job queue (see api/jobs.py)
+    return {
+        "workers": _env_int("JOB_WORKERS", 8),
+        "max_queued": _env_int("JOB_MAX_QUEUED", 1000),
+        # how long finished jobs (and their results) are kept, in seconds
+        "result_ttl": _env_float("JOB_RESULT_TTL", 3600.0),
+    }
+
+def get_run_limits():
+    # defaults for the rewrite loop, 0 means no limit (per request overrides these)
+    return {
+        "max_iterations": _env_int("MAX_ITERATIONS", 3),
+        "max_seconds": _env_float("MAX_RUN_SECONDS", 0.0),
+        "max_tokens": _env_int("MAX_RUN_TOKENS", 0),
+    }
+
+def get_rewrite_mode():
+    # "incremental" = coder sends edits on a rewrite, "full" = regenerate everything
+    mode = os.getenv("REWRITE_MODE", "incremental").lower()
+    return mode if mode in ("incremental", "full") else "incremental"
+
+# rough OpenRouter prices in USD per 1M tokens: (prompt, completion)
+# only used for the cost estimates in /metrics, override with LLM_PRICES
+DEFAULT_LLM_PRICES = {
+    "openai/gpt-4o-mini": (0.15, 0.60),
+    "openai/gpt-4o": (2.50, 10.00),
+    "openai/gpt-4-turbo": (10.00, 30.00),
+    "openai/gpt-3.5-turbo": (0.50, 1.50),
+    "anthropic/claude-3.5-sonnet": (3.00, 15.00),
+}
+
+def get_llm_prices():
+    # LLM_PRICES='{"openai/gpt-4o-mini": [0.15, 0.6]}' adds to / replaces the defaults
+    prices = dict(DEFAULT_LLM_PRICES)
+    raw = os.getenv("LLM_PRICES")
+    if raw:
+        try:
+            prices.update({model: tuple(price) for model, price in json.loads(raw).items()})
+        except (ValueError, TypeError, AttributeError):
+            pass  # bad json - keep the defaults
+    return prices
+
+AGENT_NAMES = ("architect", "coder", "tester", "reviewer", "manager")
+
+def _env_list(name):
+    # comma separated list, e.g. "openai/gpt-4o-mini,anthropic/claude-3.5-sonnet"
+    return [item.strip() for item in os.getenv(name, "").split(",") if item.strip()]
+
+def _env_floats(name):
+    values = []
+    for item in _env_list(name):
+        try:
+            values.append(float(item))
+        except ValueError:
+            pass
+    return values
+
+_agent_config_cache = {}
+
+def _agent_config_file():
+    # optional json file with per-agent settings, e.g.
+    # {"manager": {"model": "openai/gpt-4o-mini", "max_tokens": 5}}
+    path = os.getenv("AGENT_CONFIG_FILE")
+    if not path:
+        return {}
+    if path not in _agent_config_cache:
+        try:
+            with open(path) as f:
+                _agent_config_cache[path] = json.load(f)
+        except (OSError, ValueError) as e:
+            raise ValueError(f"Could not read AGENT_CONFIG_FILE '{path}': {e}")
+    return _agent_config_cache[path]
+
+def get_agent_llm_settings(agent):
+    # model settings for one agent: <AGENT>_MODEL, <AGENT>_TEMPERATURE,
+    # <AGENT>_MAX_TOKENS, <AGENT>_TIMEOUT and <AGENT>_FALLBACK_MODELS in the env
+    # win over AGENT_CONFIG_FILE, which wins over the global defaults
+    prefix = agent.upper()
+    from_file = _agent_config_file().get(agent, {})
+
+    def number(key, read, cast, default=None):
+        # env, then the file, then the default. a bad value (in either) is skipped
+        value = read(f"{prefix}_{key.upper()}", None)
+        if value is not None:
+            return value
+        try:
+            return cast(from_file[key])
+        except (KeyError, TypeError, ValueError):
+            return default
+
+    return {
+        "model": os.getenv(f"{prefix}_MODEL") or from_file.get("model") or get_openrouter_model(),
+        "temperature": number("temperature", _env_float, float, 0.0),
+        "max_tokens": number("max_tokens", _env_int, int) or None,
+        # seconds before we give up on a model and try the next fallback
+        "timeout": number("timeout", _env_float, float) or None,
+        "fallbacks": (
+            _env_list(f"{prefix}_FALLBACK_MODELS")
+            or from_file.get("fallbacks")
+            or _env_list("OPENROUTER_FALLBACK_MODELS")
+        ),
+    }
+
+def get_decision_settings():
+    # how the manager decides: "llm" always asks the model, "structured" reads the
+    # reviewer's CHANGES_REQUIRED line, "keywords" scores the review text, "auto"
+    # tries structured then keywords. anything not confident enough goes to the llm
+    strategy = os.getenv("DECISION_STRATEGY", "auto").lower()
+    return {
+        "strategy": strategy if strategy in ("llm", "structured", "keywords", "auto") else "auto",
+        "min_confidence": _env_float("DECISION_MIN_CONFIDENCE", 0.6),
+    }
+
+def get_structured_outputs():
+    # agents reply with json (see agents/schemas.py) instead of free-form markdown
+    return os.getenv("STRUCTURED_OUTPUTS", "true").lower() in ("1", "true", "yes")
+
+def get_prompt_budget_settings():
+    # prompts are measured (tiktoken) before they're sent. over PROMPT_TOKEN_BUDGET
+    # they get shrunk - see agents/prompt_budget.py. 0 turns the budget off
+    return {
+        "max_prompt_tokens": _env_int("PROMPT_TOKEN_BUDGET", 12000),
+        # how much of a prompt the architecture may take before it's condensed
+        "architecture_tokens": _env_int("PROMPT_ARCHITECTURE_TOKENS", 1500),
+        "encoding": os.getenv("PROMPT_TOKEN_ENCODING", "o200k_base"),
+    }
+
+def get_checkpoint_settings():
+    # every run is checkpointed after each node, so a failed run can be resumed
+    # from the stage that failed. an empty CHECKPOINT_SQLITE_PATH keeps them in
+    # memory only (lost on restart)
+    return {
+        "enabled": os.getenv("CHECKPOINTS_ENABLED", "true").lower() in ("1", "true", "yes"),
+        "sqlite_path": os.getenv("CHECKPOINT_SQLITE_PATH", "checkpoints.db"),
+        # seconds a failed run can still be resumed
+        "ttl": _env_int("CHECKPOINT_TTL", 86400),
+    }
+
+def get_retry_settings():
+    # retries for each llm call (see agents/resilience.py), before moving on
+    # to the agent's fallback model
+    return {
+        "max_retries": _env_int("LLM_MAX_RETRIES", 3),
+        # full jitter exponential backoff: random(0, min(max, base * 2^attempt))
+        "base_delay": _env_float("LLM_RETRY_BASE_DELAY", 0.5),
+        "max_delay": _env_float("LLM_RETRY_MAX_DELAY", 20.0),
+        # seconds for one whole call when the agent has no <AGENT>_TIMEOUT, 0 = none
+        "call_timeout": _env_float("LLM_CALL_TIMEOUT", 120.0),
+        # consecutive failures before a model's circuit opens, and how long it stays open
+        "circuit_failures": _env_int("LLM_CIRCUIT_FAILURES", 5),
+        "circuit_reset_seconds": _env_float("LLM_CIRCUIT_RESET_SECONDS", 30.0),
+    }
+
+def get_rate_limit_settings(model):
+    # client-side limits for one model (see agents/ratelimit.py), 0 = unlimited.
+    # LLM_RPM / LLM_TPM apply to every model, LLM_RATE_LIMITS overrides them per
+    # model, e.g. '{"openai/gpt-4o-mini": {"rpm": 500, "tpm": 200000}}'
+    limits = {"rpm": _env_int("LLM_RPM", 0), "tpm": _env_int("LLM_TPM", 0)}
+    raw = os.getenv("LLM_RATE_LIMITS")
+    if raw:
+        try:
+            limits.update(json.loads(raw).get(model) or {})
+        except (ValueError, TypeError, AttributeError):
+            pass  # bad json - keep the global limits
+    # with several server workers each one gets an even share of the limit
+    workers = max(_env_int("RATE_LIMIT_WORKERS", 1), 1)
+    return {
+        "rpm": int(limits.get("rpm") or 0) / workers,
+        "tpm": int(limits.get("tpm") or 0) / workers,
+        # longest a call may queue for the limiter before we give up with a 429
+        "max_wait": _env_float("RATE_LIMIT_MAX_WAIT", 30.0),
+        # completion tokens to reserve up front when the agent has no max_tokens
+        "completion_estimate": _env_int("LLM_RATE_COMPLETION_ESTIMATE", 500),
+    }
+
+def get_sandbox_settings():
+    # running the generated tests (see agents/sandbox.py). the limits keep a bad
+    # test from hogging the server, but it's not a security boundary - so it's
+    # off unless turned on, and then run the server in a container
+    return {
+        "enabled": os.getenv("SANDBOX_ENABLED", "false").lower() in ("1", "true", "yes"),
+        # test runs at once, per server process
+        "workers": max(_env_int("SANDBOX_WORKERS", 4), 1),
+        "timeout": _env_float("SANDBOX_TIMEOUT", 30.0),
+        "cpu_seconds": _env_int("SANDBOX_CPU_SECONDS", 20),
+        "memory_mb": _env_int("SANDBOX_MEMORY_MB", 512),
+        # how much pytest output to keep
+        "output_chars": _env_int("SANDBOX_OUTPUT_CHARS", 4000),
+    }
+
+def get_semantic_cache_settings():
+    # nearest-neighbour cache over past tasks (see agents/semantic_cache.py), so
+    # paraphrased tasks can reuse an approved result or its architecture
+    return {
+        "enabled": os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() in ("1", "true", "yes"),
+        # leave empty to keep the index in memory only
+        "path": os.getenv("SEMANTIC_CACHE_PATH", "semantic_cache.npz"),
+        # cosine similarity needed to return the cached result as is
+        "result_threshold": _env_float("SEMANTIC_CACHE_RESULT_THRESHOLD", 0.97),
+        # ...and to at least skip the architect and start from the cached architecture
+        "architecture_threshold": _env_float("SEMANTIC_CACHE_ARCHITECTURE_THRESHOLD", 0.85),
+        "max_entries": _env_int("SEMANTIC_CACHE_MAX_ENTRIES", 2000),
+        # optional sentence-transformers model, e.g. all-MiniLM-L6-v2. without it
+        # a built-in hashed bag-of-words embedding is used
+        "model": os.getenv("SEMANTIC_CACHE_MODEL", ""),
+        # seconds between writes of the index file (it's also written on shutdown)
+        "save_interval": _env_float("SEMANTIC_CACHE_SAVE_INTERVAL", 30.0),
+    }
+
+def get_speculative_settings():
+    # best-of-N coding (see agents/speculative.py): the coder writes several
+    # candidates at once, each is tested and reviewed, the best one goes on
+    return {
+        # 1 = off, per request "candidates" overrides it
+        "candidates": _env_int("SPECULATIVE_CANDIDATES", 1),
+        # candidate 0 uses the coder's normal settings, the others cycle through these
+        "temperatures": _env_floats("SPECULATIVE_TEMPERATURES") or [0.4, 0.8],
+        # ...and these models (empty = the coder's model)
+        "models": _env_list("SPECULATIVE_MODELS"),
+    }
+
+def get_server_settings():
+    # production server (run_production.py)
+    return {
+        "host": os.getenv("SERVER_HOST", "0.0.0.0"),
+        "port": _env_int("SERVER_PORT", 8000),
+        # worker processes, defaults to one per core
+        "workers": _env_int("SERVER_WORKERS", os.cpu_count() or 1),
+        # pending connections the kernel queues before refusing new ones
+        "backlog": _env_int("SERVER_BACKLOG", 2048),
+        # seconds an idle keep-alive connection stays open
+        "keep_alive": _env_int("SERVER_KEEP_ALIVE", 5),
+        # on SIGTERM, seconds to let in-flight generations (and jobs) finish
+        "graceful_timeout": _env_int("SERVER_GRACEFUL_TIMEOUT", 300),
+        # open connections per worker before answering 503, 0 = no limit
+        "limit_concurrency": _env_int("SERVER_LIMIT_CONCURRENCY", 0),
+        # proxies whose X-Forwarded-* headers are trusted
+        "forwarded_allow_ips": os.getenv("SERVER_FORWARDED_ALLOW_IPS", "127.0.0.1"),
+        "access_log": os.getenv("SERVER_ACCESS_LOG", "true").lower() in ("1", "true", "yes"),
+    }
+
+def get_pipeline_settings():
+    # when the agent graphs get imported and compiled (see orchestration/pipeline.py):
+    # "background" = right after startup while the server already answers /health,
+    # "startup" = before the server accepts requests, "lazy" = on the first request
+    preload = os.getenv("PIPELINE_PRELOAD", "background").lower()
+    return {"preload": preload if preload in ("background", "startup", "lazy") else "background"}
+
+def get_static_settings():
+    # the web ui in api/static (see api/static_files.py)
+    return {
+        # seconds browsers may reuse css/js without asking, 0 = revalidate every
+        # time (a cheap 304 thanks to the ETag). index.html always revalidates
+        "max_age": _env_int("STATIC_MAX_AGE", 0),
+        # write .gz (and .br if brotli is installed) next to each asset on startup
+        "precompress": os.getenv("STATIC_PRECOMPRESS", "true").lower() in ("1", "true", "yes"),
+        # responses smaller than this many bytes aren't gzipped on the fly
+        "gzip_minimum_size": _env_int("GZIP_MINIMUM_SIZE", 1000),
+        "gzip_level": _env_int("GZIP_LEVEL", 6),
+    }
+
+def get_log_settings():
+    # structured logging (see logs.py)
+    body_mode = os.getenv("LOG_BODIES", "truncate").lower()
+    return {
+        "level": os.getenv("LOG_LEVEL", "INFO").upper(),
+        # "json" = one json object per line, "text" = easier to read while developing
+        "format": "text" if os.getenv("LOG_FORMAT", "json").lower() == "text" else "json",
+        # llm outputs (code, tests, reviews...) in the logs: "truncate" = the first
+        # LOG_BODY_CHARS characters, "hash" = only length and sha256, "full" = everything
+        "bodies": body_mode if body_mode in ("truncate", "hash", "full") else "truncate",
+        "body_chars": _env_int("LOG_BODY_CHARS", 200),
+        # records waiting to be written. when it's full new records are dropped
+        # (and counted) instead of slowing down the requests
+        "queue_size": _env_int("LOG_QUEUE_SIZE", 10000),
+    }
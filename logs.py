@@ -0,0 +1,169 @@
+# structured logging for the agent pipeline
+# the agents used to print() every llm output in full, straight to stdout from
+# the request path. with many runs at once that's megabytes of interleaved lines
+# nobody can attribute, and every write blocks. now each record is a json line
+# with the run id, agent and iteration, long outputs are cut down (or only
+# hashed), and the writing happens on a background thread
+import atexit
+import contextlib
+import contextvars
+import hashlib
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+from datetime import datetime, timezone
+
+from config import get_log_settings
+
+# run_id / agent / iteration of whatever is running right now (contextvars
+# follow it into async calls, and into the candidates' threads)
+_context = contextvars.ContextVar("log_context", default={})
+
+# attributes every LogRecord has, anything else came in through extra= or the context
+_STANDARD = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+_lock = threading.Lock()
+_handler = None
+_listener = None
+
+
+def get_logger(name):
+    # everything logs under "codecraft", so it's configured in one place
+    return logging.getLogger(f"codecraft.{name}")
+
+
+@contextlib.contextmanager
+def log_context(**fields):
+    # adds the fields to every record logged inside the block
+    token = _context.set({**_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+def body(text):
+    # how an llm output (or any long text) goes into a record, see LOG_BODIES
+    text = text if isinstance(text, str) else str(text)
+    settings = get_log_settings()
+    if settings["bodies"] == "full":
+        return text
+    summary = {"chars": len(text), "sha256": hashlib.sha256(text.encode("utf-8", "replace")).hexdigest()[:16]}
+    if settings["bodies"] == "truncate":
+        summary["preview"] = text[:settings["body_chars"]]
+    return summary
+
+
+def _fields(record):
+    return {key: value for key, value in vars(record).items() if key not in _STANDARD}
+
+
+class JsonFormatter(logging.Formatter):
+    # one json object per line
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            **_fields(record)
+        }
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    # LOG_FORMAT=text: "12:00:01 INFO    [coder 3f2a9c1e] code written {...}"
+
+    def format(self, record):
+        fields = _fields(record)
+        agent, run_id = fields.pop("agent", None), fields.pop("run_id", None)
+        where = " ".join(str(part) for part in (agent, run_id and run_id[:8]) if part)
+        line = f"{self.formatTime(record, '%H:%M:%S')} {record.levelname:<7} "
+        line += f"[{where}] " if where else ""
+        line += record.getMessage()
+        if fields:
+            line += " " + json.dumps(fields, default=str, ensure_ascii=False)
+        return line
+
+
+class _BufferedHandler(logging.handlers.QueueHandler):
+    # runs in the thread that logs: adds the context and queues the record
+    # without ever waiting. when the queue is full the record is dropped
+
+    def __init__(self, records):
+        super().__init__(records)
+        self.dropped = 0
+
+    def prepare(self, record):
+        for key, value in _context.get().items():
+            if not hasattr(record, key):
+                setattr(record, key, value)
+        return super().prepare(record)
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _Listener(logging.handlers.QueueListener):
+    # writes the queued records out on its own thread
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)  # wait for room, so stopping never loses the records before it
+
+
+def setup_logging():
+    # call once on startup, before the first request
+    global _handler, _listener
+    with _lock:
+        if _handler is not None:
+            return
+        settings = get_log_settings()
+        output = logging.StreamHandler(sys.stdout)
+        output.setFormatter(TextFormatter() if settings["format"] == "text" else JsonFormatter())
+        _handler = _BufferedHandler(queue.Queue(settings["queue_size"]))
+        logger = logging.getLogger("codecraft")
+        logger.setLevel(settings["level"])
+        logger.addHandler(_handler)
+        logger.propagate = False
+        _listener = _Listener(_handler.queue, output)
+        _listener.start()
+    atexit.register(stop_logging)
+    if hasattr(os, "register_at_fork"):
+        os.register_at_fork(after_in_child=_restart_in_child)
+
+
+def _restart_in_child():
+    # a forked worker (run_production.py) doesn't get the listener thread, and
+    # the queue may be mid-use by it. start over with a fresh queue
+    global _listener, _lock
+    _lock = threading.Lock()
+    if _listener is None:
+        return
+    _handler.queue = queue.Queue(_handler.queue.maxsize)
+    _handler.dropped = 0
+    _listener = _Listener(_handler.queue, *_listener.handlers)
+    _listener.start()
+
+
+def stop_logging():
+    # write out whatever is still queued. runs at exit, forked workers call it
+    # themselves since they leave with os._exit
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+def log_stats():
+    if _handler is None:
+        return {"enabled": False}
+    return {"enabled": True, "queued": _handler.queue.qsize(), "dropped": _handler.dropped}
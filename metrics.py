@@ -0,0 +1,153 @@
+# prometheus metrics for the agent pipeline, served at /metrics
+# every graph node is timed, and every llm call records tokens, cost and
+# time-to-first-token. the same numbers go into the per-run timings list
+import contextvars
+import os
+import time
+
+from prometheus_client import REGISTRY, CollectorRegistry, Counter, Histogram, multiprocess
+
+from config import get_llm_prices
+
+STAGE_SECONDS = Histogram(
+    "codecraft_stage_seconds", "Wall time of each graph node", ["stage"],
+    buckets=(0.1, 0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300)
+)
+STAGE_ITERATION = Histogram(
+    "codecraft_stage_iteration", "Rewrite iteration a node ran in", ["stage"],
+    buckets=(1, 2, 3, 4, 5, 6, 8, 10)
+)
+LLM_TTFT_SECONDS = Histogram(
+    "codecraft_llm_time_to_first_token_seconds", "Time until the first streamed token",
+    ["agent", "model"], buckets=(0.1, 0.25, 0.5, 1, 2, 5, 10, 30)
+)
+LLM_CALLS = Counter("codecraft_llm_calls_total", "LLM calls made by agents", ["agent", "model", "cached"])
+LLM_TOKENS = Counter("codecraft_llm_tokens_total", "LLM tokens used", ["agent", "model", "kind"])
+LLM_PROMPT_TOKENS = Histogram(
+    "codecraft_llm_prompt_tokens", "Prompt size measured before sending", ["agent"],
+    buckets=(250, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000)
+)
+PROMPT_TRUNCATIONS = Counter(
+    "codecraft_prompt_truncations_total", "Prompts cut down to fit PROMPT_TOKEN_BUDGET", ["agent"]
+)
+LLM_RETRIES = Counter("codecraft_llm_retries_total", "LLM calls retried after a transient error", ["agent", "model"])
+LLM_CIRCUIT_OPENED = Counter(
+    "codecraft_llm_circuit_opened_total", "Times a model's circuit breaker opened", ["model"]
+)
+LLM_RATE_LIMIT_WAIT = Histogram(
+    "codecraft_llm_rate_limit_wait_seconds", "Time calls queued for the client-side rate limiter",
+    ["model"], buckets=(0.1, 0.5, 1, 2, 5, 10, 20, 30, 60)
+)
+LLM_RATE_LIMITED = Counter(
+    "codecraft_llm_rate_limited_total", "Calls given up because the rate limit wait was too long", ["model"]
+)
+LLM_COST = Counter("codecraft_llm_cost_usd_total", "Estimated LLM spend in USD", ["agent", "model"])
+CANDIDATE_WINS = Counter(
+    "codecraft_candidate_wins_total", "Best-of-N rounds won, by candidate (0 = the coder's own settings)", ["candidate"]
+)
+
+# llm calls made by the node that's running right now
+_node_calls = contextvars.ContextVar("node_calls", default=None)
+
+
+def metrics_registry():
+    # with several worker processes (run_production.py sets PROMETHEUS_MULTIPROC_DIR)
+    # each one writes its metrics to files there, and /metrics adds them all up
+    if not os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def estimate_cost(model, prompt_tokens, completion_tokens):
+    prompt_price, completion_price = get_llm_prices().get(model, (0.0, 0.0))
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+
+
+def record_prompt_size(agent, tokens, truncated=False):
+    LLM_PROMPT_TOKENS.labels(agent).observe(tokens)
+    if truncated:
+        PROMPT_TRUNCATIONS.labels(agent).inc()
+
+
+def record_retry(agent, model):
+    LLM_RETRIES.labels(agent, model).inc()
+
+
+def record_circuit_opened(model):
+    LLM_CIRCUIT_OPENED.labels(model).inc()
+
+
+def record_rate_limit_wait(model, seconds):
+    LLM_RATE_LIMIT_WAIT.labels(model).observe(seconds)
+
+
+def record_rate_limited(model):
+    LLM_RATE_LIMITED.labels(model).inc()
+
+
+def record_candidate_win(candidate):
+    CANDIDATE_WINS.labels(str(candidate)).inc()
+
+
+def record_llm_call(agent, model, response, ttft=None, cached=False, estimated_prompt_tokens=None):
+    usage = getattr(response, "usage_metadata", None) or {}
+    prompt_tokens = usage.get("input_tokens", 0)
+    completion_tokens = usage.get("output_tokens", 0)
+    cost = estimate_cost(model, prompt_tokens, completion_tokens)
+
+    LLM_CALLS.labels(agent, model, str(cached).lower()).inc()
+    if ttft is not None:
+        LLM_TTFT_SECONDS.labels(agent, model).observe(ttft)
+    LLM_TOKENS.labels(agent, model, "prompt").inc(prompt_tokens)
+    LLM_TOKENS.labels(agent, model, "completion").inc(completion_tokens)
+    LLM_COST.labels(agent, model).inc(cost)
+
+    calls = _node_calls.get()
+    if calls is not None:
+        calls.append({
+            "ttft": ttft,
+            "prompt_tokens": prompt_tokens,
+            # our own count before sending, also there for cache hits
+            "estimated_prompt_tokens": estimated_prompt_tokens or 0,
+            "completion_tokens": completion_tokens,
+            "cost": cost
+        })
+
+
+class StageTimer:
+    # times one graph node and collects the llm calls made inside it
+    # (contextvars follow the node into its async calls)
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.calls = []
+        self._token = _node_calls.set(self.calls)
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self._started
+        _node_calls.reset(self._token)
+        STAGE_SECONDS.labels(self.stage).observe(self.seconds)
+        return False
+
+    def timing(self, iteration):
+        STAGE_ITERATION.labels(self.stage).observe(iteration)
+        ttfts = [call["ttft"] for call in self.calls if call["ttft"] is not None]
+        return {
+            "stage": self.stage,
+            "iteration": iteration,
+            "seconds": round(self.seconds, 4),
+            "ttft": round(ttfts[0], 4) if ttfts else None,
+            "llm_calls": len(self.calls),
+            "prompt_tokens": sum(call["prompt_tokens"] for call in self.calls),
+            "estimated_prompt_tokens": sum(call["estimated_prompt_tokens"] for call in self.calls),
+            # size of each prompt the node sent, e.g. one per chunk of a chunked review
+            "call_prompt_tokens": [call["estimated_prompt_tokens"] for call in self.calls],
+            "completion_tokens": sum(call["completion_tokens"] for call in self.calls),
+            "cost": round(sum(call["cost"] for call in self.calls), 6)
+        }
@@ -0,0 +1,178 @@
+# checkpoints for graph runs
+# langgraph saves the state after every node under the run's thread id, so a
+# run that failed halfway (e.g. an openrouter error in the reviewer) can be
+# resumed from the failed node instead of paying for the architect and coder
+# again. checkpoints of runs that finished are dropped, failed ones expire
+import asyncio
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from langgraph.checkpoint.memory import InMemorySaver
+
+from config import get_checkpoint_settings
+
+
+class SQLiteSaver(InMemorySaver):
+    # langgraph's in-memory saver, with every write also going to sqlite so
+    # runs can be resumed after a restart (or on another worker process).
+    # reads come from memory, a run that isn't there is loaded from the file
+    # when it's asked for. the sqlite writes (pickle, insert, commit) happen on
+    # one writer thread, in order, so async runs don't block the event loop on them
+
+    def __init__(self, path, ttl=86400):
+        super().__init__()
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._puts = 0
+        self._conn = self._connect()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="checkpoints")
+        if path and hasattr(os, "register_at_fork"):
+            # sqlite connections mustn't be shared across a fork (run_production.py)
+            os.register_at_fork(after_in_child=self._reconnect)
+        with self._lock:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS checkpoints ("
+                "kind TEXT NOT NULL, key BLOB NOT NULL, thread_id TEXT NOT NULL, "
+                "value BLOB NOT NULL, updated_at REAL NOT NULL, PRIMARY KEY (kind, key))"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS checkpoints_thread ON checkpoints (thread_id)")
+            self._conn.commit()
+        self.prune()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path or ":memory:", check_same_thread=False, timeout=30)
+        if self.path:
+            conn.execute("PRAGMA journal_mode=WAL")  # several workers write to the same file
+        return conn
+
+    def _reconnect(self):
+        self._lock = threading.Lock()
+        self._conn = self._connect()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="checkpoints")
+
+    def _load(self, thread_id):
+        # one run's checkpoints from the file into memory
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT kind, key, value FROM checkpoints WHERE thread_id = ?", (thread_id,)
+            ).fetchall()
+        for kind, key, value in rows:
+            key, value = pickle.loads(key), pickle.loads(value)
+            if kind == "checkpoint":
+                thread_id, ns, checkpoint_id = key
+                self.storage[thread_id][ns][checkpoint_id] = value
+            elif kind == "writes":
+                self.writes[key] = value
+            else:
+                self.blobs[key] = value
+
+    def _save(self, thread_id, rows):
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO checkpoints (kind, key, thread_id, value, updated_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(kind, pickle.dumps(key), thread_id, pickle.dumps(value), now) for kind, key, value in rows]
+            )
+            self._conn.commit()
+            self._puts += 1
+            prune = self._puts % 500 == 0
+        if prune:
+            self.prune()
+
+    def get_tuple(self, config):
+        thread_id = config["configurable"]["thread_id"]
+        if self.path and not self.storage.get(thread_id):
+            # maybe another worker ran it, look in the file
+            self._load(thread_id)
+        return super().get_tuple(config)
+
+    async def aget_tuple(self, config):
+        # every new run asks for its (not yet existing) checkpoint, so the file
+        # lookup happens in a thread
+        thread_id = config["configurable"]["thread_id"]
+        if self.path and not self.storage.get(thread_id):
+            await asyncio.to_thread(self._load, thread_id)
+        return super().get_tuple(config)
+
+    def _put_rows(self, config, checkpoint, new_versions):
+        # what a put() added to memory, as rows for the file
+        thread_id = config["configurable"]["thread_id"]
+        ns = config["configurable"]["checkpoint_ns"]
+        rows = [("checkpoint", (thread_id, ns, checkpoint["id"]), self.storage[thread_id][ns][checkpoint["id"]])]
+        rows += [
+            ("blob", (thread_id, ns, channel, version), self.blobs[(thread_id, ns, channel, version)])
+            for channel, version in new_versions.items()
+        ]
+        return thread_id, rows
+
+    def _writes_rows(self, config):
+        thread_id = config["configurable"]["thread_id"]
+        key = (thread_id, config["configurable"].get("checkpoint_ns", ""), config["configurable"]["checkpoint_id"])
+        return thread_id, ([("writes", key, dict(self.writes[key]))] if key in self.writes else [])
+
+    def _write(self, thread_id, rows):
+        # queue the rows for the writer thread, returns its future
+        return self._writer.submit(self._save, thread_id, rows)
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        saved = super().put(config, checkpoint, metadata, new_versions)
+        self._write(*self._put_rows(config, checkpoint, new_versions)).result()
+        return saved
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        # the memory part is quick, the file part waits on the writer thread
+        saved = super().put(config, checkpoint, metadata, new_versions)
+        await asyncio.wrap_future(self._write(*self._put_rows(config, checkpoint, new_versions)))
+        return saved
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        super().put_writes(config, writes, task_id, task_path)
+        thread_id, rows = self._writes_rows(config)
+        if rows:
+            self._write(thread_id, rows).result()
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        super().put_writes(config, writes, task_id, task_path)
+        thread_id, rows = self._writes_rows(config)
+        if rows:
+            await asyncio.wrap_future(self._write(thread_id, rows))
+
+    def _delete_rows(self, thread_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM checkpoints WHERE thread_id = ?", (thread_id,))
+            self._conn.commit()
+
+    def delete_thread(self, thread_id):
+        super().delete_thread(thread_id)
+        self._writer.submit(self._delete_rows, thread_id).result()
+
+    async def adelete_thread(self, thread_id):
+        super().delete_thread(thread_id)
+        await asyncio.wrap_future(self._writer.submit(self._delete_rows, thread_id))
+
+    def prune(self):
+        # drop runs nobody resumed within the ttl
+        if not self.ttl:
+            return
+        with self._lock:
+            expired = [row[0] for row in self._conn.execute(
+                "SELECT thread_id FROM checkpoints GROUP BY thread_id HAVING MAX(updated_at) < ?",
+                (time.time() - self.ttl,)
+            ).fetchall()]
+        for thread_id in expired:
+            # runs on the writer thread (from _save), so delete directly instead of queueing
+            InMemorySaver.delete_thread(self, thread_id)
+            self._delete_rows(thread_id)
+
+
+def build_checkpointer():
+    settings = get_checkpoint_settings()
+    if not settings["enabled"]:
+        return None
+    return SQLiteSaver(settings["sqlite_path"], ttl=settings["ttl"])
@@ -1,44 +1,234 @@
+import threading
+import uuid
 from langgraph.graph import StateGraph
+from langchain_core.runnables import RunnableLambda
 from orchestration.state import AgentState
+from orchestration.limits import budget_exceeded, has_converged, recursion_limit
+from orchestration.checkpoints import build_checkpointer
+from metrics import StageTimer
+from logs import log_context
 from langgraph.constants import END
-from agents.architect import architect_agent
-from agents.coder import coder_agent
-from agents.tester import tester_agent
-from agents.reviewer import reviewer_agent
-from agents.manager import manager_agent
-
-# build the workflow graph
-graph = StateGraph(AgentState)
-
-# add all the agents as nodes
-graph.add_node("architect", architect_agent)
-graph.add_node("coder", coder_agent)
-graph.add_node("tester", tester_agent)
-graph.add_node("reviewer", reviewer_agent)
-graph.add_node("manager", manager_agent)
-
-graph.set_entry_point("architect")
-
-# connect them in sequence
-graph.add_edge("architect", "coder")
-graph.add_edge("coder", "tester")
-graph.add_edge("tester", "reviewer")
-graph.add_edge("reviewer", "manager")
+from agents.architect import architect_agent, architect_agent_async
+from agents.coder import coder_agent, coder_agent_async
+from agents.tester import tester_agent, tester_agent_async
+from agents.executor import executor_agent, executor_agent_async
+from agents.reviewer import (
+    reviewer_agent, reviewer_agent_async,
+    code_reviewer_agent, code_reviewer_agent_async
+)
+from agents.manager import manager_agent, manager_agent_async
+from agents.speculative import candidates_agent, candidates_agent_async, score, wants_candidates
+
+def _with_timing(stage, timer, state, update):
+    # add this node's timing to the run's breakdown
+    iteration = (update or {}).get("iteration", state.get("iteration", 0))
+    return {**(update or {}), "timings": [timer.timing(iteration)]}
+
+def _log_context(stage, state, config):
+    # every log record from inside the node says which run, agent and iteration it's from
+    return log_context(run_id=config["configurable"].get("thread_id"), agent=stage,
+                       iteration=state.get("iteration", 0))
+
+def agent_node(stage, sync_fn, async_fn=None):
+    # app.invoke() runs the sync version, app.ainvoke() the async one
+    # both are timed and show up in /metrics and the run's timings
+    def run(state, config):
+        with _log_context(stage, state, config), StageTimer(stage) as timer:
+            update = sync_fn(state)
+        return _with_timing(stage, timer, state, update)
+
+    async def arun(state, config):
+        with _log_context(stage, state, config), StageTimer(stage) as timer:
+            update = await async_fn(state) if async_fn else sync_fn(state)
+        return _with_timing(stage, timer, state, update)
+
+    return RunnableLambda(run, afunc=arun)
+
+def join_node(state):
+    # barrier for the parallel topology - runs once both the tests (written
+    # and run) and the review are done. they write different keys so nothing to merge
+    # by hand, langgraph already folded both updates into the state
+    return {}
+
+# what an iteration produced - kept for the best one so far
+BEST_FIELDS = (
+    "code", "code_files", "previous_code", "changed_functions",
+    "tests", "test_files", "test_results", "review", "review_spec"
+)
+
+def track_best(state, update):
+    # after the manager: remember this iteration if it's the best so far (share of
+    # tests passing, then the review's verdict - the same score as best-of-N).
+    # ties go to the later one, it has seen more reviews
+    current = {**state, **(update or {})}
+    ranked = list(score(current))
+    best = state.get("best")
+    if best is not None and ranked < best["score"]:
+        return update
+    snapshot = {"iteration": current.get("iteration", 0), "score": ranked}
+    snapshot.update({field: current.get(field) for field in BEST_FIELDS})
+    return {**(update or {}), "best": snapshot}
+
+def with_best(sync_fn, async_fn):
+    def run(state):
+        return track_best(state, sync_fn(state))
+
+    async def arun(state):
+        return track_best(state, await async_fn(state))
+
+    return run, arun
+
+def best_node(state):
+    # out of budget: return the best version so far rather than the one the
+    # manager just rejected
+    best = state.get("best")
+    if not best:
+        return {"best_iteration": state.get("iteration", 0)}
+    return {**{field: best[field] for field in BEST_FIELDS}, "best_iteration": best["iteration"]}
+
+def coding_node(state):
+    # best-of-N runs write, test and review all candidates in one node
+    return "candidates" if wants_candidates(state) else "coder"
+
+def start_node(state):
+    return coding_node(state) if state.get("architecture") else "architect"
 
 def route_decision(state):
     # check what the manager decided
     decision = state.get("decision", "approve")
     # make sure it's a valid decision
-    return decision if decision in ["rewrite", "approve"] else "approve"
-
-# conditional edge - loop back to coder if rewrite, otherwise end
-graph.add_conditional_edges(
-    "manager",
-    route_decision,
-    {
-        "rewrite": "coder",
-        "approve": END
+    if decision not in ["rewrite", "approve"]:
+        return "approve"
+    # out of iterations / time / tokens - stop with the best version we have
+    if decision == "rewrite" and budget_exceeded(state):
+        return "stop"
+    return coding_node(state) if decision == "rewrite" else decision
+
+def after_coder(next_nodes):
+    # skip testing and reviewing again if the rewrite didn't change anything
+    def route(state):
+        if has_converged(state):
+            return END
+        return next_nodes
+    return route
+
+def build_graph(parallel=False):
+    # build the workflow graph
+    graph = StateGraph(AgentState)
+
+    # add all the agents as nodes
+    graph.add_node("architect", agent_node("architect", architect_agent, architect_agent_async))
+    graph.add_node("coder", agent_node("coder", coder_agent, coder_agent_async))
+    graph.add_node("tester", agent_node("tester", tester_agent, tester_agent_async))
+    # runs the tests the tester just wrote, the results go to the reviewer/manager
+    graph.add_node("executor", agent_node("executor", executor_agent, executor_agent_async))
+    graph.add_edge("tester", "executor")
+    graph.add_node("manager", agent_node("manager", *with_best(manager_agent, manager_agent_async)))
+    graph.add_node("best", best_node)
+    graph.add_edge("best", END)
+    # several coder attempts at once, each tested and reviewed - the best goes to the manager
+    graph.add_node("candidates", agent_node("candidates", candidates_agent, candidates_agent_async))
+    graph.add_conditional_edges("candidates", after_coder("manager"))
+
+    # start at the coder if the run already has an architecture
+    graph.set_conditional_entry_point(start_node, ["architect", "coder", "candidates"])
+    graph.add_conditional_edges("architect", coding_node, ["coder", "candidates"])
+
+    if parallel:
+        # tester (+ executor) and a code-only review both fan out from
+        # coder, then meet at join before the manager
+        graph.add_node("reviewer", agent_node("reviewer", code_reviewer_agent, code_reviewer_agent_async))
+        graph.add_node("join", agent_node("join", join_node))
+        graph.add_conditional_edges("coder", after_coder(["tester", "reviewer"]))
+        graph.add_edge(["executor", "reviewer"], "join")
+        graph.add_edge("join", "manager")
+    else:
+        # connect them in sequence
+        graph.add_node("reviewer", agent_node("reviewer", reviewer_agent, reviewer_agent_async))
+        graph.add_conditional_edges("coder", after_coder("tester"))
+        graph.add_edge("executor", "reviewer")
+        graph.add_edge("reviewer", "manager")
+
+    # conditional edge - loop back to coder if rewrite, otherwise end
+    graph.add_conditional_edges(
+        "manager",
+        route_decision,
+        {
+            "coder": "coder",
+            "candidates": "candidates",
+            "approve": END,
+            "stop": "best"
+        }
+    )
+    return graph
+
+# topology name (picked per request in the api) -> build_graph(parallel=...)
+TOPOLOGIES = {
+    "sequential": False,
+    "parallel": True
+}
+
+# compiled on first use rather than at import, see orchestration/pipeline.py
+_compiled = {}
+_checkpointer = None
+_compile_lock = threading.RLock()
+
+def get_checkpointer():
+    # shared by both topologies, a run's thread id says which run it is
+    global _checkpointer
+    with _compile_lock:
+        if _checkpointer is None:
+            _checkpointer = build_checkpointer() or False  # False = checkpoints turned off
+        return _checkpointer or None
+
+def get_app(topology="sequential"):
+    if topology not in TOPOLOGIES:
+        raise ValueError(f"Unknown topology '{topology}', expected one of: {', '.join(TOPOLOGIES)}")
+    app = _compiled.get(topology)
+    if app is None:
+        with _compile_lock:
+            app = _compiled.get(topology)
+            if app is None:
+                app = _compiled[topology] = build_graph(parallel=TOPOLOGIES[topology]).compile(
+                    checkpointer=get_checkpointer()
+                )
+    return app
+
+def warm_up():
+    # compile every topology now, so the first request doesn't pay for it
+    for topology in TOPOLOGIES:
+        get_app(topology)
+
+def run_config(state, run_id=None):
+    # config to pass along with the initial state to invoke/ainvoke/astream
+    # run_id is the checkpoint thread id, a new one unless we're resuming
+    return {
+        "recursion_limit": recursion_limit(state),
+        "configurable": {"thread_id": run_id or uuid.uuid4().hex}
     }
-)
 
-app = graph.compile()
+def run_id_of(config):
+    return config["configurable"]["thread_id"]
+
+def saved_run(run_id):
+    # (compiled graph, its state) for a checkpointed run, None if we don't have it
+    checkpointer = get_checkpointer()
+    if checkpointer is None:
+        return None
+    saved = checkpointer.get_tuple({"configurable": {"thread_id": run_id}})
+    if saved is None:
+        return None
+    topology = saved.checkpoint["channel_values"].get("topology") or "sequential"
+    return get_app(topology), saved.checkpoint["channel_values"]
+
+def finish_run(run_id):
+    # the run is done, its checkpoints aren't needed anymore
+    checkpointer = get_checkpointer()
+    if checkpointer is not None:
+        checkpointer.delete_thread(run_id)
+
+async def afinish_run(run_id):
+    # finish_run for the async routes, the file delete happens off the event loop
+    checkpointer = get_checkpointer()
+    if checkpointer is not None:
+        await checkpointer.adelete_thread(run_id)
@@ -0,0 +1,64 @@
+# limits for the rewrite loop
+# without these a reviewer that never approves keeps sending us back to the
+# coder until langgraph gives up with a GraphRecursionError
+import time
+
+from config import get_run_limits
+
+
+def initial_limits(max_iterations=None, max_seconds=None, max_tokens=None):
+    # the budget fields a run starts with, request values win over config
+    defaults = get_run_limits()
+    return {
+        "iteration": 0,
+        "started_at": time.time(),
+        "max_iterations": max_iterations or defaults["max_iterations"],
+        "max_seconds": max_seconds or defaults["max_seconds"],
+        "max_tokens": max_tokens or defaults["max_tokens"],
+        "tokens_used": 0
+    }
+
+
+def budget_exceeded(state):
+    # returns why we should stop looping, or None if there's budget left
+    max_iterations = state.get("max_iterations")
+    if max_iterations and state.get("iteration", 0) >= max_iterations:
+        return "max_iterations"
+
+    max_seconds = state.get("max_seconds")
+    started_at = state.get("started_at")
+    if max_seconds and started_at and time.time() - started_at >= max_seconds:
+        return "time_budget"
+
+    max_tokens = state.get("max_tokens")
+    if max_tokens and state.get("tokens_used", 0) >= max_tokens:
+        return "token_budget"
+    return None
+
+
+def normalize_code(code):
+    # ignore whitespace-only differences between two versions
+    lines = (line.rstrip() for line in (code or "").strip().splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+def has_converged(state):
+    # the coder rewrote the code but produced the same thing again
+    if state.get("iteration", 0) < 2 or state.get("previous_code") is None:
+        return False
+    return normalize_code(state.get("code")) == normalize_code(state.get("previous_code"))
+
+
+def stop_reason(state):
+    # why the run ended, for the api response
+    if has_converged(state):
+        return "converged"
+    if state.get("decision") == "approve":
+        return "approved"
+    return budget_exceeded(state) or "approved"
+
+
+def recursion_limit(state):
+    # enough graph steps for max_iterations rounds of the loop
+    # with no iteration cap the time/token budget has to end it, so allow plenty
+    return 10 + 6 * (state.get("max_iterations") or 15)
@@ -0,0 +1,80 @@
+# lazy access to the agent pipeline
+# orchestration.graph imports langgraph, langchain_openai and every agent and
+# then compiles the graphs. that's a couple of seconds, and it used to happen
+# when api.routes was imported - before the server could even answer /health.
+# the api goes through this module instead, which loads the graphs on first
+# use or ahead of time from warm_up() (startup hook, run_production.py)
+import asyncio
+import threading
+import time
+
+from logs import get_logger
+
+log = get_logger(__name__)
+
+_lock = threading.Lock()
+_status = {"state": "cold", "seconds": None, "error": None}
+
+
+def _graph():
+    import orchestration.graph
+    return orchestration.graph
+
+
+def warm_up():
+    # import and compile everything now, returns how long it took
+    with _lock:
+        if _status["state"] == "ready":
+            return _status["seconds"]
+        _status["state"] = "loading"
+        started = time.perf_counter()
+        try:
+            _graph().warm_up()
+        except Exception as e:
+            _status.update(state="failed", error=repr(e))
+            log.exception("pipeline failed to load")
+            raise
+        _status.update(state="ready", seconds=round(time.perf_counter() - started, 3), error=None)
+    log.info("pipeline ready", extra={"seconds": _status["seconds"]})
+    return _status["seconds"]
+
+
+async def ensure_ready():
+    # for async routes: load it in a thread so the event loop keeps answering
+    # (/health included) while the graphs are imported and compiled
+    if _status["state"] != "ready":
+        await asyncio.to_thread(warm_up)
+
+
+def is_ready():
+    return _status["state"] == "ready"
+
+
+def pipeline_status():
+    # "cold", "loading", "ready" or "failed", with the load time or error
+    return dict(_status)
+
+
+# same as in orchestration.graph, but they only import it when called
+def get_app(topology="sequential"):
+    return _graph().get_app(topology)
+
+
+def run_config(state, run_id=None):
+    return _graph().run_config(state, run_id)
+
+
+def run_id_of(config):
+    return _graph().run_id_of(config)
+
+
+def saved_run(run_id):
+    return _graph().saved_run(run_id)
+
+
+def finish_run(run_id):
+    return _graph().finish_run(run_id)
+
+
+async def afinish_run(run_id):
+    return await _graph().afinish_run(run_id)
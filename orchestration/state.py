@@ -1,4 +1,5 @@
-from typing import TypedDict, Optional
+import operator
+from typing import TypedDict, Optional, Annotated, List, Dict
 
 # state that gets passed between agents
 class AgentState(TypedDict):
@@ -8,3 +9,49 @@ class AgentState(TypedDict):
     tests: Optional[str]
     review: Optional[str]
     decision: Optional[str]
+
+    # structured agent outputs (see agents/schemas.py), None if the model
+    # didn't return valid json and we fell back to the text above
+    structured_outputs: Optional[bool]
+    architecture_spec: Optional[dict]
+    code_files: Optional[List[dict]]
+    test_files: Optional[List[dict]]
+    review_spec: Optional[dict]
+
+    # how the manager decides, and what actually decided (see agents/decision.py)
+    decision_strategy: Optional[str]
+    decision_source: Optional[str]
+
+    # "sequential" or "parallel", so a checkpointed run resumes on the same graph
+    topology: Optional[str]
+
+    # per-request model settings per agent, on top of config (see agents/llm.py)
+    llm_overrides: Optional[Dict[str, dict]]
+
+    # rewrite loop bookkeeping (see orchestration/limits.py)
+    iteration: int  # how many times the coder has run
+    previous_code: Optional[str]
+    started_at: float
+    max_iterations: int
+    max_seconds: Optional[float]
+    max_tokens: Optional[int]
+
+    # pytest run of the generated tests (see agents/sandbox.py)
+    execute_tests: Optional[bool]
+    test_results: Optional[dict]
+
+    # best iteration so far, returned when a budget ends the run (see orchestration/graph.py)
+    best: Optional[dict]
+    best_iteration: Optional[int]
+
+    # best-of-N coding (see agents/speculative.py)
+    candidates: Optional[int]
+    candidate_scores: Optional[List[dict]]
+
+    # incremental rewrites (see agents/edits.py)
+    rewrite_mode: str  # "incremental" or "full"
+    changed_functions: Optional[List[str]]
+    # every agent adds its own usage, so parallel nodes can both write it
+    tokens_used: Annotated[int, operator.add]
+    # one entry per node run: wall time, ttft, tokens, cost (see metrics.py)
+    timings: Annotated[List[dict], operator.add]
@@ -0,0 +1,163 @@
+"""
+Script to run the FastAPI server in production
+
+The app (and with it the compiled agent graphs) is imported once, then
+SERVER_WORKERS processes are forked that all accept on the same socket.
+SIGTERM (or Ctrl+C) lets every worker finish its in-flight generations
+before it exits. For development, use run_server.py instead.
+"""
+import gc
+import glob
+import importlib.util
+import os
+import shutil
+import signal
+import sys
+import tempfile
+import time
+
+import uvicorn
+
+from config import get_server_settings
+from logs import get_logger, setup_logging, stop_logging
+
+log = get_logger("server")
+
+
+def _metrics_dir(workers):
+    # metrics have to be collected across processes, see metrics_registry()
+    # this must happen before prometheus_client is imported
+    if workers < 2:
+        return None, False
+    path = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    created = not path
+    if created:
+        path = tempfile.mkdtemp(prefix="codecraft-metrics-")
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = path
+    for stale in glob.glob(os.path.join(path, "*.db")):
+        os.remove(stale)  # left over from the last run
+    return path, created
+
+
+def _uvicorn_options(settings):
+    # uvloop and httptools (pip install "uvicorn[standard]") are a lot faster
+    # than the pure python defaults, but not available everywhere (no uvloop on windows)
+    loop = "uvloop" if importlib.util.find_spec("uvloop") else "asyncio"
+    http = "httptools" if importlib.util.find_spec("httptools") else "h11"
+    log.info("server options", extra={"loop": loop, "http": http})
+    return {
+        "host": settings["host"],
+        "port": settings["port"],
+        "loop": loop,
+        "http": http,
+        "lifespan": "on",
+        "backlog": settings["backlog"],
+        "timeout_keep_alive": settings["keep_alive"],
+        "timeout_graceful_shutdown": settings["graceful_timeout"],
+        "limit_concurrency": settings["limit_concurrency"] or None,
+        "proxy_headers": True,
+        "forwarded_allow_ips": settings["forwarded_allow_ips"],
+        "access_log": settings["access_log"]
+    }
+
+
+def _start_worker(config, sock):
+    pid = os.fork()
+    if pid:
+        return pid
+    # child: uvicorn installs its own SIGINT/SIGTERM handlers and shuts down
+    # gracefully - stop accepting, wait for open requests, then the app's
+    # shutdown hooks (which drain the background jobs)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    try:
+        uvicorn.Server(config).run(sockets=[sock])
+    finally:
+        stop_logging()  # os._exit skips atexit, write out what's still queued first
+        os._exit(0)
+
+
+def _supervise(config, sock, workers, graceful_timeout):
+    from prometheus_client import multiprocess
+
+    children = {}  # pid -> when it started
+    stopping_at = None
+    killed = False
+
+    def stop(signum, frame):
+        nonlocal stopping_at
+        if stopping_at is None:
+            log.info("got a signal, draining the workers", extra={"signal": signum, "workers": len(children)})
+            stopping_at = time.monotonic()
+            for pid in children:
+                os.kill(pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for _ in range(workers):
+        children[_start_worker(config, sock)] = time.monotonic()
+    log.info("started the workers", extra={"workers": workers, "pids": list(children)})
+
+    while children:
+        pid, status = os.waitpid(-1, os.WNOHANG)
+        if not pid:
+            # requests drain first, then jobs, each with up to graceful_timeout
+            if not killed and stopping_at is not None and time.monotonic() - stopping_at > 2 * graceful_timeout + 10:
+                log.warning("workers still running after the grace period, killing them",
+                            extra={"pids": list(children)})
+                for child in children:
+                    os.kill(child, signal.SIGKILL)
+                killed = True
+            time.sleep(0.2)
+            continue
+        if pid not in children:
+            continue
+        started = children.pop(pid)
+        if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+            multiprocess.mark_process_dead(pid)
+        if stopping_at is None:
+            # crashed - replace it, but don't spin if it dies right at startup
+            log.error("worker exited, restarting it", extra={"pid": pid, "status": status})
+            if time.monotonic() - started < 1:
+                time.sleep(1)
+            children[_start_worker(config, sock)] = time.monotonic()
+    log.info("all workers stopped")
+
+
+def main():
+    setup_logging()
+    settings = get_server_settings()
+    workers = max(settings["workers"], 1)
+    # each worker has its own rate limiter buckets, give each an even share
+    os.environ.setdefault("RATE_LIMIT_WORKERS", str(workers))
+
+    if workers > 1 and not hasattr(os, "fork"):
+        # windows: no fork, so let uvicorn spawn the workers (each imports the app itself)
+        _metrics_dir(workers)
+        uvicorn.run("api.main:app", workers=workers, **_uvicorn_options(settings))
+        return
+
+    metrics_dir, created = _metrics_dir(workers)
+    try:
+        # import and compile everything once, before forking, so the compiled
+        # graphs, pydantic models etc. are shared copy-on-write by every worker
+        from api.main import app
+        from orchestration.pipeline import warm_up
+        warm_up()
+        config = uvicorn.Config(app, **_uvicorn_options(settings))
+        config.load()
+        if workers == 1:
+            uvicorn.Server(config).run()
+            return
+        sock = config.bind_socket()
+        # keep the gc from touching (and so copying) the preloaded objects in the workers
+        gc.freeze()
+        _supervise(config, sock, workers, settings["graceful_timeout"])
+    finally:
+        if created:
+            shutil.rmtree(metrics_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())